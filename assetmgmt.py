@@ -0,0 +1,233 @@
+import argparse
+import importlib
+import os
+import sys
+import time
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+import 性能追踪
+
+
+# 命令行入口, 所有策略共用:
+#     python -m assetmgmt list
+#     python -m assetmgmt run fixed_fractional --config run.toml
+#     python -m assetmgmt run --config a.toml --config b.toml --report "{name}.png"
+#
+# 配置文件 (TOML), 顶层是默认值, 每个 [[runs]] 是一次回测, 覆盖顶层的设置; 没有 [[runs]] 就只跑一次:
+#     strategy = "fixed_fractional"
+#     data = "螺纹钢主力连续（近10年）.xlsx"    # data / output / report 的相对路径都相对于配置文件所在目录
+#     output = "{name}.csv"                   # 可选, .csv / .parquet / .xlsx
+#     report = "{name}.png"                   # 可选, .png / .html, 不弹窗口
+#     [params]
+#     C = 50000
+#     f = 0.1
+#     [[runs]]
+#     name = "f=0.05"
+#     params = { f = 0.05 }
+#
+# 策略模块和 pandas 等只在真正要跑时导入, matplotlib 只在 --plot 时导入
+# --profile / --trace 记录每次回测各阶段 (read_data / backtest / metrics / output / report) 的时间和内存, 见 性能追踪.py
+
+
+def _fixed_fractional(m, df, p):
+    return m.backtest(df, p["C"], p["f"], p["loss_limit"], p["guarantee"])
+
+
+def _fixed_ratio(m, df, p):
+    return m.backtest(df, p["C"], p["delta"], p["guarantee"])
+
+
+def _volatility_ratio(m, df, p):
+    atr = m.ATR(df, p["atr_days"], p["method"])
+    return m.backtest(df, p["C"], atr, p["vol"], p["vp"], p["guarantee"])
+
+
+def _ma_crossover(m, df, p):
+    sma = m.ma_i(df, p["slow"])
+    fma = m.ma_i(df, p["fast"])
+    return m.backtest(df, p["C"], p["f"], p["loss_limit"], p["guarantee"], sma, fma)
+
+
+def _conservative_aggressive(m, df, p):
+    return m.backtest(df, p["C"], p["split"], p["f"], p["loss_limit"], p["delta"], p["guarantee"],
+                         p["transfer"], p["period"])
+
+
+def _asset_plot(m, final_df, C, path=None):
+    m.total_asset_plot(final_df["时间"], final_df["Total_asset"], C, path)
+
+
+def _dual_plot(m, final_df, C, path=None):
+    m.total_asset_plot(final_df, C, path)
+
+
+# 策略名 -> 模块, 默认参数 (与各脚本 __main__ 里的一致), 回测函数, 画图函数
+STRATEGIES = {
+    "fixed_fractional": ("固定分数法", {"C": 50000, "f": 0.1, "loss_limit": 1250, "guarantee": 0.16},
+                         _fixed_fractional, _asset_plot),
+    "fixed_ratio": ("固定比例法", {"C": 100000, "delta": 20000, "guarantee": 0.16},
+                    _fixed_ratio, _asset_plot),
+    "volatility_ratio": ("波动比例法", {"C": 100000, "atr_days": 50, "method": "simple", "vol": 0.02,
+                                        "vp": 10, "guarantee": 0.16},
+                         _volatility_ratio, _asset_plot),
+    "diminishing_f": ("递减f值法", {"C": 100000, "f": 0.04, "loss_limit": 1250, "guarantee": 0.16},
+                      _fixed_fractional, _asset_plot),
+    "equity_curve": ("净值曲线交易", {"C": 1000000, "f": 0.1, "loss_limit": 1250, "guarantee": 0.16},
+                     _fixed_fractional, _asset_plot),
+    "ma_crossover": ("移动均线交叉策略", {"C": 1000000, "f": 0.3, "loss_limit": 6700, "guarantee": 0.16,
+                                          "slow": 75, "fast": 40},
+                     _ma_crossover, _asset_plot),
+    "conservative_aggressive": ("保守激进资金组合", {"C": 100000, "split": 0.7, "f": 0.05, "loss_limit": 1250,
+                                                     "delta": 20000, "guarantee": 0.16, "transfer": "sweep",
+                                                     "period": 20},
+                                _conservative_aggressive, _dual_plot),
+}
+
+
+def load_runs(path, strategy=None):
+    '''
+    :param path: TOML 配置文件
+    :param strategy: 命令行给的策略名, 配置里没写 strategy 时用它
+    :return: List[dict], 每次回测一个 dict: name, strategy, data, output, report, params
+    '''
+    with open(path, "rb") as fp:
+        config = tomllib.load(fp)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    stem = os.path.splitext(os.path.basename(path))[0]
+    runs = config.pop("runs", None) or [{}]
+
+    result = []
+    for k, run in enumerate(runs):
+        merged = {**config, **run, "params": {**config.get("params", {}), **run.get("params", {})}}
+        merged.setdefault("strategy", strategy)
+        merged.setdefault("name", stem if len(runs) == 1 else f"{stem}-{k}")
+        if merged["strategy"] is None:
+            raise ValueError(f"{path}: no strategy for run {merged['name']!r}, set it in the config or on the command line")
+        if merged["strategy"] not in STRATEGIES:
+            raise ValueError(f"{path}: unknown strategy {merged['strategy']!r}, "
+                             f"choose from {', '.join(STRATEGIES)}")
+        if "data" not in merged:
+            raise ValueError(f"{path}: no data file for run {merged['name']!r}")
+        defaults = STRATEGIES[merged["strategy"]][1]
+        unknown = set(merged["params"]) - set(defaults)
+        if unknown:
+            raise ValueError(f"{path}: unknown params {sorted(unknown)} for {merged['strategy']}, "
+                             f"expected {sorted(defaults)}")
+        merged["params"] = {**defaults, **merged["params"]}
+        for key in ("data", "output", "report"):
+            if merged.get(key):
+                merged[key] = os.path.join(base_dir, os.path.expanduser(merged[key]))
+        result.append(merged)
+    return result
+
+
+def _target(pattern, run):
+    return pattern.format(name=run["name"], strategy=run["strategy"]) if pattern else None
+
+
+def _save(final_df, path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        final_df.to_csv(path, index=False)
+    elif ext == ".parquet":
+        final_df.to_parquet(path, index=False)
+    else:
+        final_df.to_excel(path, index=False)
+
+
+def run(config):
+    '''
+    :param config: load_runs 返回的一项
+    :return: (BacktestResult, metrics); 只有要保存或画图时才转成 DataFrame
+    '''
+    from 绩效指标 import metrics
+
+    module_name, _, backtest, plot = STRATEGIES[config["strategy"]]
+    with 性能追踪.stage(config["name"], category=config["strategy"]):
+        with 性能追踪.stage("import"):
+            m = importlib.import_module(module_name)
+        p = config["params"]
+        with 性能追踪.stage("read_data"):
+            df = m.read_data(config["data"])
+        with 性能追踪.stage("backtest", bars=len(df)):
+            result = backtest(m, df, p)
+        with 性能追踪.stage("metrics"):
+            summary = metrics(result["Total_asset"], result["contract_number"])
+
+        output = _target(config.get("output"), config)
+        report = _target(config.get("report"), config)
+        if output or report or config.get("plot"):
+            with 性能追踪.stage("to_frame"):
+                final_df = result.to_frame()
+            if output:
+                with 性能追踪.stage("output"):
+                    _save(final_df, output)
+            if report:
+                with 性能追踪.stage("report"):
+                    plot(m, final_df, p["C"], report)
+            if config.get("plot"):
+                with 性能追踪.stage("plot"):
+                    plot(m, final_df, p["C"])
+    return result, summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="assetmgmt", description="Asset-management strategy backtests")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list the strategies and their default params")
+    run_parser = commands.add_parser("run", help="run one or more configs")
+    run_parser.add_argument("strategy", nargs="?", choices=list(STRATEGIES),
+                            help="strategy for configs that do not set one")
+    run_parser.add_argument("--config", "-c", action="append", default=[],
+                            help="TOML config file, can be given several times")
+    run_parser.add_argument("--data", help="data file, overrides the configs")
+    run_parser.add_argument("--output", "-o", help="save each result table, e.g. '{name}.csv'")
+    run_parser.add_argument("--report", "-r", help="save each equity curve, e.g. '{name}.png'")
+    run_parser.add_argument("--plot", action="store_true", help="show the plots (loads matplotlib)")
+    run_parser.add_argument("--profile", help="write per-stage wall/CPU time and peak memory as JSON")
+    run_parser.add_argument("--trace", help="write a Chrome trace (chrome://tracing, ui.perfetto.dev)")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for name, (module_name, defaults, _, _) in STRATEGIES.items():
+            print(f"{name:<24} {module_name:<10} {defaults}")
+        return 0
+
+    if not args.config and not (args.strategy and args.data):
+        run_parser.error("needs --config, or a strategy and --data")
+    runs = []
+    for path in args.config:
+        try:
+            runs.extend(load_runs(path, args.strategy))
+        except (OSError, ValueError) as e:
+            run_parser.error(str(e))
+    if not args.config:
+        runs.append({"name": args.strategy, "strategy": args.strategy, "data": args.data,
+                     "params": dict(STRATEGIES[args.strategy][1])})
+
+    if args.profile or args.trace:
+        性能追踪.enable()
+    for config in runs:
+        for key in ("data", "output", "report"):
+            if getattr(args, key):
+                config[key] = getattr(args, key)
+        config["plot"] = args.plot
+
+        start = time.perf_counter()
+        _, result = run(config)
+        print(f"{config['name']:<20} {config['strategy']:<24} final_equity={result['final_equity']:.2f} "
+              f"return={result['total_return']:.2%} max_drawdown={result['max_drawdown']:.2%} "
+              f"sharpe={result['sharpe']:.3f} ({time.perf_counter() - start:.2f}s)")
+    if args.profile:
+        性能追踪.to_json(args.profile)
+    if args.trace:
+        性能追踪.to_chrome_trace(args.trace)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
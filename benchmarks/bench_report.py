@@ -0,0 +1,11 @@
+import 报告
+
+
+def bench_downsample(measure, ohlc):
+    measure(报告.downsample, ohlc["收盘价(元)"].to_numpy())
+
+
+def bench_asset_report(benchmark, ohlc, tmp_path):
+    # 默认 n_points, K线数多于 2000 时走降采样
+    path = str(tmp_path / "report.png")
+    benchmark.pedantic(报告.asset_report, args=(path, ohlc["时间"], ohlc["收盘价(元)"], 3500), rounds=1)
@@ -0,0 +1,99 @@
+import shutil
+
+import pytest
+
+import 数据加载
+import 固定分数法
+import 固定比例法
+import 波动比例法
+import 递减f值法
+import 净值曲线交易
+import 移动均线交叉策略
+from 绩效指标 import metrics
+
+
+SCRIPTS = {
+    "固定分数法": 固定分数法,
+    "固定比例法": 固定比例法,
+    "波动比例法": 波动比例法,
+    "递减f值法": 递减f值法,
+    "净值曲线交易": 净值曲线交易,
+    "移动均线交叉策略": 移动均线交叉策略,
+}
+IDS = {
+    "固定分数法": "fixed_fractional",
+    "固定比例法": "fixed_ratio",
+    "波动比例法": "volatility_ratio",
+    "递减f值法": "diminishing_f",
+    "净值曲线交易": "equity_curve",
+    "移动均线交叉策略": "ma_crossover",
+}
+
+
+def _indicators(name, df):
+    if name == "波动比例法":
+        return (波动比例法.ATR(df, 50),)
+    if name == "移动均线交叉策略":
+        return 移动均线交叉策略.ma_i(df, 75), 移动均线交叉策略.ma_i(df, 40)
+    return ()
+
+
+def _backtest(name, df, ind):
+    # 参数与各脚本 __main__ 里的一致
+    if name == "固定分数法":
+        return 固定分数法.backtest(df, 50000, 0.1, 1250, 0.16)
+    if name == "固定比例法":
+        return 固定比例法.backtest(df, 100000, 20000, 0.16)
+    if name == "波动比例法":
+        return 波动比例法.backtest(df, 100000, ind[0], 0.02, 10, 0.16)
+    if name == "递减f值法":
+        return 递减f值法.backtest(df, 100000, 0.04, 1250, 0.16)
+    if name == "净值曲线交易":
+        return 净值曲线交易.backtest(df, 1000000, 0.1, 1250, 0.16)
+    return 移动均线交叉策略.backtest(df, 1000000, 0.3, 6700, 0.16, *ind)
+
+
+@pytest.fixture(params=list(SCRIPTS), ids=list(IDS.values()))
+def script(request):
+    return request.param
+
+
+@pytest.fixture
+def loaded(script, source_file):
+    return SCRIPTS[script].read_data(source_file)  # backtest 不修改 df, 不用复制
+
+
+# Loading
+def bench_load_cold(benchmark, source_file, cache_dir):
+    # 第一次读取: 解析源文件并写 .npy 缓存
+    columns = ["时间", "最高价(元)", "最低价(元)", "收盘价(元)", "涨跌幅(%)"]
+
+    def clear():
+        shutil.rmtree(数据加载.cache_path(source_file), ignore_errors=True)
+        return (source_file, columns), {}
+    benchmark.pedantic(数据加载.load_columns, setup=clear, rounds=3)
+
+
+def bench_load(measure, script, source_file):
+    SCRIPTS[script].read_data(source_file)  # 先建好缓存
+    measure(SCRIPTS[script].read_data, source_file)
+
+
+# Indicators
+@pytest.mark.parametrize("script", ["波动比例法", "移动均线交叉策略"],
+                         ids=["volatility_ratio", "ma_crossover"])
+def bench_indicators(measure, script, loaded):
+    measure(_indicators, script, loaded)
+
+
+# Backtest loop
+def bench_backtest(measure, script, loaded):
+    ind = _indicators(script, loaded)
+    _backtest(script, loaded, ind)  # 先编译 (numba)
+    measure(_backtest, script, loaded, ind)
+
+
+# Metrics
+def bench_metrics(measure, script, loaded):
+    result = _backtest(script, loaded, _indicators(script, loaded))
+    measure(metrics, result["Total_asset"], result["contract_number"])
@@ -0,0 +1,85 @@
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import 数据加载  # noqa: E402
+
+
+def pytest_addoption(parser):
+    parser.addoption("--bars", default="1e3,1e4,1e5,1e6,1e7",
+                     help="逗号分隔的K线数, e.g. --bars 1e3,1e5")
+
+
+def pytest_generate_tests(metafunc):
+    if "bars" in metafunc.fixturenames:
+        sizes = [int(float(x)) for x in metafunc.config.getoption("bars").split(",")]
+        metafunc.parametrize("bars", sizes, ids=[f"{n:.0e}".replace("+0", "") for n in sizes],
+                             scope="session")
+
+
+def synthetic_ohlc(n, seed=0):
+    '''
+    :param n: K线数
+    :return: DataFrame, 与 Excel 数据同样的列; 整段价格的波动幅度与 n 无关, 价格始终为正
+    时间      最高价(元)    最低价(元)     收盘价(元)    涨跌幅(%)
+    '''
+    rng = np.random.default_rng(seed)
+    log_ret = rng.normal(0, 0.01, n) / np.sqrt(max(n / 2500, 1))
+    close = np.round(3500 * np.exp(np.cumsum(log_ret)))
+    spread = np.abs(rng.normal(0, 0.005, (2, n)))
+    change = np.zeros(n)
+    change[1:] = (close[1:] / close[:-1] - 1) * 100
+    return pd.DataFrame({
+        "时间": pd.date_range("2009-01-01", periods=n, freq="min"),
+        "最高价(元)": np.round(close * (1 + spread[0])),
+        "最低价(元)": np.round(close * (1 - spread[1])),
+        "收盘价(元)": close,
+        "涨跌幅(%)": change,
+    })
+
+
+@pytest.fixture(scope="session")
+def ohlc(bars):
+    return synthetic_ohlc(bars)
+
+
+@pytest.fixture(scope="session")
+def source_file(bars, ohlc, tmp_path_factory):
+    # Excel 最多约100万行, 所以用同样列的 CSV 作为源文件
+    path = tmp_path_factory.mktemp("data") / f"rb_{bars}.csv"
+    ohlc.to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def cache_dir(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("cache"))
+    数据加载.CACHE_DIR = path
+    return path
+
+
+def peak_memory_mb(func, *args):
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 2 ** 20
+
+
+@pytest.fixture
+def measure(benchmark):
+    '''
+    先单独跑一次记录内存峰值 (写进结果的 extra_info), 再计时
+    '''
+    def run(func, *args):
+        benchmark.extra_info["peak_mem_mb"] = round(peak_memory_mb(func, *args), 3)
+        return benchmark(func, *args)
+    return run
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def close():
+    # 约 2 年的日线, 价格始终为正
+    log_ret = np.random.default_rng(0).normal(0, 0.01, 500)
+    return np.round(3500 * np.exp(np.cumsum(log_ret)))
+
+
+@pytest.fixture
+def df(close):
+    return pd.DataFrame({"时间": pd.date_range("2019-01-01", periods=len(close)), "收盘价(元)": close})
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+from 保守激进资金组合 import dual_account
+from 回测内核 import fixed_fractional, fixed_ratio
+
+
+@pytest.mark.parametrize("splits", [0.0, 1.0, [0.5, 1.2], -0.1])
+def test_splits_outside_open_interval(close, splits):
+    with pytest.raises(ValueError):
+        dual_account(close, 100000, splits, fixed_fractional(0.05, 1250), fixed_ratio(20000), 0.16)
+
+
+@pytest.mark.parametrize("transfer", ["sweep", "rebalance", None])
+def test_no_contracts_without_equity(transfer):
+    # 价格一路下跌: 激进账户很快亏光, 之后不能再开仓
+    price = np.linspace(4000, 2000, 300)
+    result = dual_account(price, 100000, [0.5, 0.9], fixed_fractional(0.05, 1250), fixed_ratio(20000), 0.16,
+                          transfer=transfer)
+    for account in ("conservative", "aggressive"):
+        broke = result[f"asset_{account}"] <= 0
+        assert np.all(result[f"contract_{account}"][broke] == 0)
@@ -0,0 +1,15 @@
+import numpy as np
+import pytest
+
+import 净值曲线交易
+
+
+@pytest.mark.parametrize("kind", ["sma", "ema"])
+@pytest.mark.parametrize("window", [20, 60])
+def test_average_column_gates_trading(df, kind, window):
+    # 资金低于报告里的均线那天不开仓, 其他天就是固定分数法的合约数
+    result = 净值曲线交易.backtest(df, 1000000, 0.1, 1250, 0.16, window=window, kind=kind)
+    ave = result[净值曲线交易.average_column(window, kind)]
+    total = result["Total_asset"]
+    expected = np.where(ave <= total, np.trunc(total * 0.1 / 1250), 0)
+    np.testing.assert_array_equal(result["contract_number"][1:], expected[1:])
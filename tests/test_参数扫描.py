@@ -0,0 +1,23 @@
+import pandas as pd
+
+from 参数扫描 import ma_crossover_sweep
+from 回测内核 import PositionLedger
+
+
+def test_sweep_with_ledgers_repr(close):
+    # ledger 列里每格是一个 PositionLedger, pandas 不能把它当成序列去取下标
+    table = ma_crossover_sweep(close, 1000000, [60, 40], [20], [0.1], [6700], 0.16, processes=1,
+                               keep_ledgers=True)
+    text = repr(table)
+    assert "PositionLedger(500 bars" in text
+    assert all(isinstance(ledger, PositionLedger) for ledger in table["ledger"])
+    assert table["ledger"][0].final_equity == table["final_equity"][0]
+
+
+def test_pool_matches_serial(close):
+    # 很多组参数结果相同 (不交易的组合), 排序后顺序也要与单进程一致
+    args = (close, 1000000, [60, 40, 30, 20], [10, 5], [0.05, 0.1], [6700, 20000000], 0.16)
+    serial = ma_crossover_sweep(*args, processes=1)
+    pooled = ma_crossover_sweep(*args, processes=2)
+    assert serial["final_equity"].duplicated().any()
+    pd.testing.assert_frame_equal(serial, pooled)
@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+
+from 固定比例法 import delta_table
+
+
+def test_delta_table_paths_match_summary(df):
+    deltas = [10000, 20000, 50000]
+    summary = delta_table(df, 100000, deltas, 0.16)
+    table, paths = delta_table(df, 100000, deltas, 0.16, paths=True)
+    pd.testing.assert_frame_equal(summary, table)
+    assert list(paths.index) == list(df["时间"])
+
+
+def test_delta_table_without_time_column(close):
+    frame = pd.DataFrame({"收盘价(元)": close}, index=pd.RangeIndex(100, 100 + len(close)))
+    table, paths = delta_table(frame, 100000, [20000], 0.16, paths=True)
+    assert paths.index.equals(frame.index)
+    np.testing.assert_allclose(paths[20000].iloc[-1], table["final_equity"][0])
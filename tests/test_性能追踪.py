@@ -0,0 +1,39 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import 性能追踪
+from 指标 import atr_array, ma_array
+
+
+@pytest.fixture
+def tracing():
+    性能追踪.reset()
+    性能追踪.enable(memory=False)
+    yield
+    性能追踪.disable()
+    性能追踪.reset()
+
+
+def test_array_helpers_record_one_stage(close, tracing):
+    ma_array(close, 20)
+    atr_array(close, close, close, 20)
+    assert [r["name"] for r in 性能追踪.records()] == ["ma_batch", "atr_batch"]
+
+
+def test_disable_keeps_caller_tracemalloc():
+    tracemalloc.start()
+    try:
+        性能追踪.enable(memory=True)
+        with 性能追踪.stage("work"):
+            np.ones(1000)
+        性能追踪.disable()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+        性能追踪.reset()
+
+    性能追踪.enable(memory=True)
+    性能追踪.disable()
+    assert not tracemalloc.is_tracing()
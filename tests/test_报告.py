@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+import 报告
+
+
+# 降采样: 长度不是桶数整数倍时, 下标也不能越界, 每个桶的最高点、最低点都要保留
+@pytest.mark.parametrize("n, n_buckets", [(1000, 300), (1000, 600), (2500, 1000), (2501, 1000), (9999, 7)])
+def test_minmax_index_uneven(n, n_buckets):
+    y = np.random.default_rng(n).random(n)
+    idx = 报告.minmax_index(y, n_buckets)
+    assert idx[0] == 0 and idx[-1] == n - 1
+    assert np.all(np.diff(idx) > 0)
+    assert len(idx) <= 2 * n_buckets + 2
+    assert y[idx].min() == y.min() and y[idx].max() == y.max()
+
+
+@pytest.mark.parametrize("n, n_points", [(2500, 2000), (1000, 600)])
+def test_asset_report_long_curve(df, tmp_path, n, n_points):
+    # K线数多于 n_points 时走降采样
+    x = np.resize(df["时间"].to_numpy(), n)
+    y = np.resize(df["收盘价(元)"].to_numpy(), n)
+    path = str(tmp_path / "report.png")
+    assert 报告.asset_report(path, x, y, 3500, n_points=n_points) == path
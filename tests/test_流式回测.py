@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from 回测内核 import backtest_arrays, equity_filter, fixed_fractional
+from 流式回测 import StreamingBacktest
+
+
+@pytest.mark.parametrize("kind", ["sma", "ema", "drawdown"])
+def test_save_load_filtered_rule(close, kind, tmp_path):
+    # 中途存盘再读回来接着跑, 与一次跑完的回测结果相同
+    def rule():
+        return equity_filter(fixed_fractional(0.1, 1250), 20, kind)
+
+    path = tmp_path / "run.pkl"
+    run = StreamingBacktest(1000000, rule(), 0.16)
+    run.on_bars(close[:250])
+    run.save(path)
+    resumed = StreamingBacktest.load(path)
+
+    con = [resumed.on_bar(c)[0] for c in close[250:]]
+    expected, total, _, _ = backtest_arrays(close, 1000000, rule(), 0.16, use_jit=False)
+    np.testing.assert_array_equal(con, expected[250:])
+    assert resumed.total_asset == pytest.approx(total[-1])
@@ -0,0 +1,229 @@
+import pandas as pd
+import numpy as np
+
+from 回测内核 import BacktestResult, fixed_fractional, fixed_ratio
+from 数据加载 import load_columns
+from 报告 import asset_report
+
+
+def read_data(path): # 读取数据
+    '''
+    :param path: 存有螺纹钢主连的收盘价等数据
+    :return:
+    日期      收盘价(元)
+    ...         ...
+    ...         ...
+    '''
+    return load_columns(path, ["时间", "收盘价(元)"])  # 第一次之后走缓存
+
+
+def _start(rule, C, B):
+    # 与 backtest_batch 相同: 状态展开成每组一份
+    if rule.size_vec is None:
+        raise ValueError(f"{rule.name} has no vectorized size function")
+    con0, params, st = rule.init(C)
+    aux = () if rule.aux is None else np.asarray(rule.aux, dtype=np.float64)
+    st = np.array(st, dtype=np.float64)
+    if st.ndim == 1:
+        st = np.repeat(st[:, None], B, axis=1)
+    con = np.broadcast_to(np.asarray(con0, dtype=np.float64), (B,)).copy()
+    return con, params, aux, st
+
+
+def dual_account(price, C, splits, conservative, aggressive, guarantee, transfer="sweep",
+                 period=20, multiplier=10):
+    '''
+    保守-激进资金组合: 资金分成保守账户和激进账户, 各用一个仓位规则, 两个账户在同一个时间循环里一起推进
+    splits 可以是一组比例, 每个比例一列, 一次算完; 账户资金 <= 0 时这个账户不开仓
+
+    :param price: array, 每天收盘价
+    :param C: 初始资金
+    :param splits: 保守账户占初始资金的比例, 标量或 (B,), 每个都在 (0, 1) 之间
+    :param conservative: SizingRule, 保守账户的规则, e.g. fixed_fractional(0.05, 1250)
+    :param aggressive: SizingRule, 激进账户的规则, e.g. fixed_ratio(20000)
+    :param guarantee: 保证金比例
+    :param transfer: 每 period 天两个账户之间怎么转资金
+        "sweep": 激进账户超过其初始资金的盈利转入保守账户
+        "rebalance": 按 splits 重新分配两个账户的资金
+        None: 不转
+    :param period: 转资金的间隔天数, >= 1
+    :return: dict, 每项都是 (天数, B)
+        contract_conservative / contract_aggressive: 两个账户的合约数
+        asset_conservative / asset_aggressive: 两个账户的资金
+        contract_number / Total_asset / Used_asset / Lever_ratio: 两个账户合计
+    '''
+    if transfer not in ("sweep", "rebalance", None):
+        raise ValueError(f"unknown transfer {transfer!r}")
+    if period < 1:
+        raise ValueError(f"period must be >= 1, got {period}")
+    price = np.asarray(price, dtype=np.float64)
+    n = len(price)
+    splits = np.atleast_1d(np.asarray(splits, dtype=np.float64))
+    if np.any(~((splits > 0) & (splits < 1))):
+        raise ValueError(f"splits must be strictly between 0 and 1, got {splits}")
+    B = len(splits)
+    base_c = splits * C  # 两个账户的初始资金
+    base_a = C - base_c
+
+    con_c, params_c, aux_c, st_c = _start(conservative, base_c, B)
+    con_a, params_a, aux_a, st_a = _start(aggressive, base_a, B)
+    total_c, total_a = base_c.copy(), base_a.copy()
+    con_c, con_a = np.where(total_c > 0, con_c, 0.0), np.where(total_a > 0, con_a, 0.0)
+
+    con_cons, con_aggr = np.empty((n, B)), np.empty((n, B))
+    asset_cons, asset_aggr = np.empty((n, B)), np.empty((n, B))
+    con_cons[0], con_aggr[0], asset_cons[0], asset_aggr[0] = con_c, con_a, total_c, total_a
+
+    for t in range(1, n):
+        move = multiplier * (price[t] - price[t - 1])  # 每手当天的盈亏
+        total_c = total_c + con_c * move
+        total_a = total_a + con_a * move
+        if transfer is not None and t % period == 0:
+            if transfer == "sweep":
+                profit = np.maximum(total_a - base_a, 0)
+                total_c = total_c + profit
+                total_a = total_a - profit
+            else:
+                whole = total_c + total_a
+                total_c = splits * whole
+                total_a = whole - total_c
+        con_c = np.broadcast_to(conservative.size_vec(t, total_c, con_c, params_c, aux_c, st_c), (B,))
+        con_a = np.broadcast_to(aggressive.size_vec(t, total_a, con_a, params_a, aux_a, st_a), (B,))
+        # 亏光的账户不再开仓 (fixed_ratio 至少给 1 手)
+        con_c = np.where(total_c > 0, con_c, 0.0)
+        con_a = np.where(total_a > 0, con_a, 0.0)
+        con_cons[t], con_aggr[t], asset_cons[t], asset_aggr[t] = con_c, con_a, total_c, total_a
+
+    con_num = con_cons + con_aggr
+    total_asset = asset_cons + asset_aggr
+    value = con_num * multiplier * price[:, None]  # 合约价值
+    return {
+        "contract_conservative": con_cons,
+        "contract_aggressive": con_aggr,
+        "asset_conservative": asset_cons,
+        "asset_aggressive": asset_aggr,
+        "contract_number": con_num,
+        "Total_asset": total_asset,
+        "Used_asset": value * guarantee / total_asset,
+        "Lever_ratio": value / total_asset,
+    }
+
+
+def backtest(df, C, split, f, loss_limit, delta, guarantee, transfer="sweep", period=20,
+             con_dtype=np.int32, dtype=np.float64): # 进行回测
+    '''
+    保守账户用固定分数法, 激进账户用固定比例法
+
+    :param df:
+        日期      收盘价(元)
+        ...         ...
+        ...         ...
+    :param C: 初始资金
+    :param split: 保守账户占初始资金的比例
+    :param f: 保守账户的风险比例
+    :param loss_limit: 每份合约允许的最大亏损额
+    :param delta: 激进账户平均每份合约增加 delta 的时候, 再多买进一份合约
+    :param guarantee: 保证金比例
+    :param transfer: "sweep" / "rebalance" / None, 见 dual_account
+    :param period: 转资金的间隔天数
+    :param con_dtype: 合约数的类型
+    :param dtype: 资金/比例的类型, np.float32 可以省一半内存
+    :return: BacktestResult, 不修改 df; 要 DataFrame 用 backtest_df
+    '''
+    result = dual_account(df["收盘价(元)"].to_numpy(), C, split, fixed_fractional(f, loss_limit),
+                          fixed_ratio(delta), guarantee, transfer, period)
+    return BacktestResult(df, {key: value[:, 0].astype(con_dtype if key.startswith("contract") else dtype)
+                               for key, value in result.items()})
+
+
+def backtest_df(df, C, split, f, loss_limit, delta, guarantee, transfer="sweep", period=20):
+    '''
+    与 backtest 相同, 结果转成 DataFrame
+    :return: 新的 DataFrame, df 本身不变
+        日期   收盘价(元)   contract_conservative   contract_aggressive   asset_conservative   asset_aggressive   contract_number   Total_asset   Used_asset   Lever_ratio
+        ...     ...         ...                     ...                   ...                  ...                ...               ...           ...          ...
+    '''
+    return backtest(df, C, split, f, loss_limit, delta, guarantee, transfer, period).to_frame()
+
+
+def split_table(df, C, splits, f, loss_limit, delta, guarantee, transfer="sweep", period=20):
+    '''
+    一组保守账户比例一次算完
+
+    :return: DataFrame, 每个比例一行
+        split    final_equity    final_conservative    final_aggressive    min_equity    max_lever
+    '''
+    result = dual_account(df["收盘价(元)"].to_numpy(), C, splits, fixed_fractional(f, loss_limit),
+                          fixed_ratio(delta), guarantee, transfer, period)
+    return pd.DataFrame({
+        "split": np.atleast_1d(splits),
+        "final_equity": result["Total_asset"][-1],
+        "final_conservative": result["asset_conservative"][-1],
+        "final_aggressive": result["asset_aggressive"][-1],
+        "min_equity": result["Total_asset"].min(axis=0),
+        "max_lever": result["Lever_ratio"].max(axis=0),
+    })
+
+
+def total_asset_plot(df, C, path=None): # 资金变化曲线
+    '''
+    :param df: backtest_df 的结果
+    :param C: 初始资金
+    :param path: 保存为 .png / .html 文件 (不弹窗口, 曲线降采样); None 则 plt.show()
+    :return: None，因为要画图
+    '''
+    if path is not None:
+        asset_report(path, df["时间"], df["Total_asset"], C,
+                     "Total asset when using Conservative-Aggressive accounts",
+                     series={"Conservative": df["asset_conservative"], "Aggressive": df["asset_aggressive"]})
+        return
+
+    x = df["时间"]
+    import matplotlib.pyplot as plt  # 只在画图时加载
+    fig, ax = plt.subplots()
+    ax.plot(x, df["Total_asset"], label="Total")
+    ax.plot(x, df["asset_conservative"], label="Conservative")
+    ax.plot(x, df["asset_aggressive"], label="Aggressive")
+    # 设置其他参数
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Asset(yuan)")
+    ax.set_xticks(x[::90])
+    ax.set_title("Total asset when using Conservative-Aggressive accounts", fontsize=13)
+
+    # 总资产最高点和最低点
+    x = x.to_list()
+    y = df["Total_asset"].to_list()
+    ind_max = y.index(max(y))
+    ind_min = y.index(min(y))
+    max_benefit = (max(y) - C) * 100 / C
+    min_benefit = (min(y) - C) * 100 / C
+    ax.axhline(C, color="red", linestyle="--")
+
+    ax.text(x[ind_min], y[ind_min], f"Min:{min(y)}, Benefit:{min_benefit}%")
+    ax.text(x[ind_max], y[ind_max], f"Max:{max(y)}, Benefit:{max_benefit}%")
+    ax.text(x[0], y[0], f"Orginal Asset:{C}")
+
+    ax.grid(linestyle="--")
+    ax.legend()
+
+    # 自动调整x坐标轴
+    plt.gcf().autofmt_xdate()
+    # Show the figure
+    plt.show()
+
+
+if __name__ == '__main__':
+    path = "/Users/yuwensun/Documents/实习/申港资管投资部23Summer/资管方法及其应用/螺纹钢主力连续（近10年）.xlsx"
+    df = read_data(path)
+    # 交易参数设置
+    C = 100000  # 初始资金
+    split = 0.7  # 保守账户比例
+    f = 0.05  # 保守账户风险比例
+    loss_limit = 1250  # 每份合约最大亏损值
+    delta = 20000  # 激进账户每份合约盈利 delta 加一份
+    guarantee = 0.16  # 保证金比例
+
+    print(split_table(df, C, np.arange(0.1, 1.0, 0.1), f, loss_limit, delta, guarantee))
+
+    final_df = backtest_df(df, C, split, f, loss_limit, delta, guarantee)
+    total_asset_plot(final_df, C)
@@ -1,9 +1,11 @@
 #Import Packages
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from datetime import datetime
+
+from 回测内核 import backtest_batch, backtest_result, equity_filter, filter_ema, fixed_fractional
+from 指标 import rolling_mean
+from 数据加载 import load_columns
+from 报告 import asset_report
 
 # Example:固定分数法
 # Data Loader
@@ -15,13 +17,12 @@ def read_data(path):
     ...         ...
     ...         ...
     '''
-    source_df = pd.read_excel(path)
-    df = source_df[["时间", "收盘价(元)"]]
-    return df
+    return load_columns(path, ["时间", "收盘价(元)"])  # 第一次之后走缓存
 
 
 # Trade results
-def backtest_df(df, C, f, loss_limit, guarantee):
+def backtest(df, C, f, loss_limit, guarantee, window=30, kind="sma", threshold=0.1,
+             con_dtype=np.int32, dtype=np.float64):
     '''
     :param df:
         日期      收盘价(元)
@@ -30,68 +31,81 @@ def backtest_df(df, C, f, loss_limit, guarantee):
     :param C: 初始资金
     :param loss_limit: 每份合约允许的最大亏损额
     :param guarantee: 保证金比例
-    :return:
+    :param window: 资金均线的天数
+    :param kind: "sma" / "ema" / "drawdown", 见 回测内核.equity_filter
+    :param threshold: kind="drawdown" 时允许的最大回撤比例
+    :param con_dtype: 合约数的类型
+    :param dtype: 资金/比例的类型, np.float32 可以省一半内存
+    :return: BacktestResult, 结果列放在各自的数组里, 不修改 df; 要 DataFrame 用 backtest_df
+        另外一列是过滤用的资金均线, 列名见 average_column; kind="drawdown" 时没有这一列
+    '''
+    rule = equity_filter(fixed_fractional(f, loss_limit), window, kind, threshold)
+    result = backtest_result(df, C, rule, guarantee, con_dtype, dtype)
+    total = np.asarray(result["Total_asset"], dtype=np.float64)
+    if kind == "sma":
+        ave_asset = rolling_mean(total, window)  # 与过滤的口径相同: 前 window-1 天取当天资金
+    elif kind == "ema":
+        ave_asset = filter_ema(total, window)  # 与过滤里的 EMA 逐天相同
+    else:
+        return result
+    result.columns[average_column(window, kind)] = ave_asset.astype(dtype, copy=False)
+    return result
+
+
+def average_column(window=30, kind="sma"):
+    '''
+    :return: str, backtest 结果里资金均线的列名, e.g. "Average_asset(30days)" / "EMA_asset(30days)"
+    '''
+    return f"{'EMA' if kind == 'ema' else 'Average'}_asset({window}days)"
+
+
+def backtest_df(df, C, f, loss_limit, guarantee, window=30, kind="sma", threshold=0.1):
+    '''
+    与 backtest 相同, 结果转成 DataFrame
+    :return: 新的 DataFrame, df 本身不变
         日期      收盘价(元)      contract_number     Total_asset     Used_asset
         ...         ...             ...                 ...             ...
         ...         ...             ...                 ...             ...
     '''
-    con_num1 = int(C * f / loss_limit)  # 合约数 at day1
-
-    total_asset = C * np.ones(len(df))  # 总资金 at day1
-    ave_asset = C * np.ones(len(df))  # 30天平均资金
-    con_num = con_num1 * np.ones(len(df))  # 合约数 at day1
-    used_asset = (con_num1 * 10 *
-                  df["收盘价(元)"][0] * guarantee / C) * np.ones(len(df))  # 占用资金 at day1
-    lever_ratio = (con_num1 * 10 *
-                   df["收盘价(元)"][0] / C) * np.ones(len(df))  # 杠杆率 at day1
-
-    for index in range(1, len(df)):
-        # Total asset
-        total = con_num[index - 1] * 10 * (df["收盘价(元)"][index] - df["收盘价(元)"][index - 1])
-        total_asset[index] = total_asset[index - 1] + total
-
-        '''
-        Below is added section: Equity curve trading
-        '''
-        # Average total asset
-        if (index >= 30-1):
-            ave_asset[index] = total_asset[index - 29:index + 1].mean()
-        else:
-            ave_asset[index] = total_asset[index]
-
-        # Contract number
-        if (ave_asset[index] > total_asset[index]):
-            con_num[index] = 0
-        else:
-            con_num[index] = int(total_asset[index] * f / loss_limit)
-
-        '''
-        End section
-        '''
-
-        # Used asset
-        used_asset[index] = con_num[index] * 10 * df["收盘价(元)"][index] * guarantee / total_asset[index]
-        lever_ratio[index] = con_num[index] * 10 * df["收盘价(元)"][index] / total_asset[index]
-
-    df["contract_number"] = con_num
-    df["Total_asset"] = total_asset
-    df["Used_asset"] = used_asset
-    df["Lever_ratio"] = lever_ratio
-    df["Average_asset(30days)"] = ave_asset
-
-    return df
+    return backtest(df, C, f, loss_limit, guarantee, window, kind, threshold).to_frame()
+
+
+def window_table(df, C, rule, guarantee, windows, kind="sma", threshold=0.1):
+    '''
+    净值曲线过滤套在任意仓位规则外面, 一组窗口一次算完 (所有窗口一起逐天推进)
+
+    :param rule: SizingRule, e.g. 回测内核.volatility_ratio(atr, 0.02, 10) / fixed_ratio(20000)
+    :param windows: array, 资金均线的天数
+    :param kind: "sma" / "ema" / "drawdown", 见 回测内核.equity_filter
+    :return: DataFrame, 每个窗口一行
+        window    final_equity    min_equity    max_drawdown    max_lever
+    '''
+    windows = np.atleast_1d(np.asarray(windows, dtype=np.int64))
+    result = backtest_batch(df["收盘价(元)"].to_numpy(), C, equity_filter(rule, windows, kind, threshold),
+                            guarantee, keep_paths=False)
+    return pd.DataFrame({"window": windows, **result})
+
 
 # [优化1]
 # 计算周期均线（周期=30天），如果资金 < 30天均线，立刻停止交易
 #
 # Total asset line v.s. 30 average asset line
-def total_30ave_plot(df):  # input is dataframe from backtest_df()
+def total_30ave_plot(df, path=None, window=30, kind="sma"):  # input is dataframe from backtest_df()
+    # window / kind 与 backtest_df 的参数一致
+    column = average_column(window, kind)
+    label = f"{'EMA' if kind == 'ema' else 'Average'} asset ({window}days)"
+    title = f"Total_asset v.s. {label}"
+    if path is not None:  # 保存为 .png / .html 文件, 不弹窗口
+        asset_report(path, df["时间"], df["Total_asset"], title=title, series={label: df[column]})
+        return
+
+    import matplotlib.pyplot as plt  # 只在画图时加载
     figure, ax = plt.subplots()
     ax.plot(df["时间"], df["Total_asset"], '-.', label="Total_asset")
-    ax.plot(df["时间"], df["Average_asset(30days)"], '--', label="Average price (30days)")
+    ax.plot(df["时间"], df[column], '--', label=label)
     ax.set_xlabel("Date")
     ax.set_ylabel("Asset")
-    ax.set_title("Total_asset v.s. Average asset (30days)")
+    ax.set_title(title)
 
     plt.legend()
 
@@ -102,12 +116,18 @@ def total_30ave_plot(df):  # input is dataframe from backtest_df()
 
 
 # Asset plot
-def total_asset_plot(x, y, C):
+def total_asset_plot(x, y, C, path=None):
     '''
     :param x: 图像的x值，一般是日期
     :param y: 图像y值，一般是total asset value
+    :param path: 保存为 .png / .html 文件 (不弹窗口, 曲线降采样); None 则 plt.show()
     :return: None，因为要画图
     '''
+    if path is not None:
+        asset_report(path, x, y, C, "Total asset when using Fixed Fractional")
+        return
+
+    import matplotlib.pyplot as plt  # 只在画图时加载
     fig, ax = plt.subplots()
     ax.plot(x, y)
     # 设置其他参数
@@ -144,6 +164,9 @@ if __name__ == '__main__':
     loss_limit = 1250  # 每份合约最大亏损值
     guarantee = 0.16  # 保证金比例
 
+    # 不同窗口的净值曲线过滤
+    print(window_table(df, C, fixed_fractional(f, loss_limit), guarantee, [10, 20, 30, 60, 120]))
+
     final_df = backtest_df(df, C, f, loss_limit, guarantee)
 
     total_30ave_plot(final_df)
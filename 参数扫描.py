@@ -0,0 +1,182 @@
+import itertools
+import os
+from contextlib import contextmanager
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+import pandas as pd
+
+from 回测内核 import PositionLedger, backtest_arrays, crossover_signal, ma_crossover
+from 指标 import ma_batch
+from 绩效指标 import max_drawdown
+
+
+# 共享内存: 价格和均线只放一份, 子进程直接映射, 不用每个任务pickle一次
+def share_array(arr):
+    '''
+    :param arr: np.ndarray
+    :return: (SharedMemory, spec); spec = (name, shape, dtype) 传给子进程用 attach_array 打开
+    '''
+    arr = np.ascontiguousarray(arr)
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+    return shm, (shm.name, arr.shape, arr.dtype.str)
+
+
+def attach_array(spec):
+    '''
+    :param spec: share_array 返回的 spec
+    :return: (SharedMemory, np.ndarray), 需要一直持有 SharedMemory, 否则数组失效
+    '''
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+_shared = {}  # 本进程里可以用的共享数组: key -> (SharedMemory 或 None, np.ndarray)
+
+
+def attach_shared(specs):
+    '''
+    进程池的 initializer: 子进程里映射好主进程共享出来的数组, 之后用 get_shared 取
+    :param specs: Dict[str, spec], shared_arrays 给出的
+    '''
+    for key, spec in specs.items():
+        _shared[key] = attach_array(spec)
+
+
+def get_shared(key):
+    '''
+    :return: np.ndarray, shared_arrays / attach_shared 放进来的数组 (只读着用, 不要修改)
+    '''
+    return _shared[key][1]
+
+
+@contextmanager
+def shared_arrays(arrays, in_process=False):
+    '''
+    把数组放进共享内存, 退出时释放
+
+    >>> with shared_arrays({"close": close}) as specs:
+    ...     with Pool(processes, initializer=attach_shared, initargs=(specs,)) as pool:
+    ...         pool.map(task, ...)  # task 里 get_shared("close")
+
+    :param arrays: Dict[str, np.ndarray]
+    :param in_process: True 时不开共享内存, 在本进程里直接用 get_shared 取 (processes=1 时)
+    :return: context manager, 给出 specs (in_process 时为 None)
+    '''
+    if in_process:
+        _shared.update({key: (None, arr) for key, arr in arrays.items()})
+        try:
+            yield None
+        finally:
+            for key in arrays:
+                _shared.pop(key, None)
+        return
+
+    blocks = {}
+    try:
+        for key, arr in arrays.items():
+            blocks[key] = share_array(arr)
+        yield {key: spec for key, (_, spec) in blocks.items()}
+    finally:
+        for shm, _ in blocks.values():
+            shm.close()
+            shm.unlink()
+
+
+def _run_pair(task):
+    # 一对(慢线, 快线)只算一次交叉信号, 再跑所有的 (f, loss_limit)
+    i_slow, i_fast, slow, fast, combos, C, guarantee, multiplier, keep_ledgers = task
+    close = get_shared("close")
+    ma = get_shared("ma")
+    sma, fma = ma[i_slow], ma[i_fast]
+    sig = crossover_signal(sma, fma)
+
+    rows = []
+    for f, loss_limit in combos:
+        rule = ma_crossover(sma, fma, f, loss_limit, signal=sig)
+        con_num, total_asset, used_asset, lever_ratio = backtest_arrays(
+            close, C, rule, guarantee, multiplier)
+        row = (slow, fast, f, loss_limit, total_asset[-1], max_drawdown(total_asset),
+               lever_ratio.max(), lever_ratio.mean())
+        if keep_ledgers:  # 只传回换仓记录, 价格在主进程里补上
+            ledger = PositionLedger.from_arrays(close, con_num, total_asset, guarantee, multiplier)
+            row += ((ledger.index, ledger.contracts, ledger.equity),)
+        rows.append(row)
+    return rows
+
+
+def ma_crossover_sweep(close, C, slow_windows, fast_windows, fs, loss_limits, guarantee,
+                       multiplier=10, processes=None, sort_by="final_equity", keep_ledgers=False):
+    '''
+    移动均线交叉策略的参数扫描
+
+    :param close: array, 收盘价
+    :param C: 初始资金
+    :param slow_windows: Iterable[int], 慢线天数
+    :param fast_windows: Iterable[int], 快线天数 (只跑 fast < slow 的组合)
+    :param fs: Iterable[float], 风险比例
+    :param loss_limits: Iterable[float], 每份合约最大亏损值
+    :param guarantee: 保证金比例
+    :param processes: 进程数, None 为 CPU 核数, 1 为不开进程池
+    :param sort_by: 排序的列, 默认按最终资金从高到低
+    :param keep_ledgers: True 时每组参数多一列 ledger (PositionLedger, 只存换仓记录),
+        可以事后重建任何一组的完整资金曲线, 几千组也只占很少内存
+    :return: DataFrame
+        rank    slow    fast    f    loss_limit    final_equity    max_drawdown    max_lever    mean_lever
+        ...     ...     ...     ...  ...           ...             ...             ...          ...
+    '''
+    close = np.ascontiguousarray(close, dtype=np.float64)
+    slow_windows = [int(w) for w in slow_windows]
+    fast_windows = [int(w) for w in fast_windows]
+    windows = sorted(set(slow_windows) | set(fast_windows))
+    pos = {w: k for k, w in enumerate(windows)}
+    ma = ma_batch(close, windows)  # 每个窗口只算一次
+
+    combos = list(itertools.product(fs, loss_limits))
+    tasks = [(pos[s], pos[fw], s, fw, combos, C, guarantee, multiplier, keep_ledgers)
+             for s in slow_windows for fw in fast_windows if fw < s]
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    rows = []
+    serial = processes == 1 or len(tasks) <= 1
+    with shared_arrays({"close": close, "ma": ma}, in_process=serial) as specs:
+        if serial:
+            for task in tasks:
+                rows.extend(_run_pair(task))
+        else:
+            with Pool(processes, initializer=attach_shared, initargs=(specs,)) as pool:
+                for part in pool.imap(_run_pair, tasks):  # 按任务顺序, 相同指标的行与单进程时顺序一致
+                    rows.extend(part)
+
+    columns = ["slow", "fast", "f", "loss_limit", "final_equity", "max_drawdown", "max_lever", "mean_lever"]
+    if keep_ledgers:
+        rows = [row[:-1] + (PositionLedger(close, *row[-1], guarantee, multiplier),) for row in rows]
+        columns.append("ledger")
+    result = pd.DataFrame(rows, columns=columns)
+    ascending = sort_by in ("max_drawdown", "max_lever", "mean_lever")
+    result = result.sort_values(sort_by, ascending=ascending, kind="stable").reset_index(drop=True)
+    result.insert(0, "rank", np.arange(1, len(result) + 1))
+    return result
+
+
+if __name__ == '__main__':
+    from 移动均线交叉策略 import read_data
+
+    path = "/Users/yuwensun/Documents/实习/申港资管投资部23Summer/资管方法及其应用/螺纹钢主力连续（近10年）.xlsx"
+    df = read_data(path)
+
+    # 交易参数设置
+    C = 1000000  # 初始资金
+    guarantee = 0.16  # 保证金比例
+
+    result = ma_crossover_sweep(df["收盘价(元)"].to_numpy(), C,
+                                slow_windows=range(50, 201, 5),
+                                fast_windows=range(10, 101, 5),
+                                fs=[0.1, 0.2, 0.3],
+                                loss_limits=[2500, 5000, 6700],
+                                guarantee=guarantee)
+    print(result.head(20))
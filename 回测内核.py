@@ -0,0 +1,795 @@
+import importlib.util
+import math
+import numpy as np
+
+from 性能追踪 import traced
+
+
+# numba 可选, 没装时用纯 Python 循环 + NumPy; 第一次回测时才导入 (导入本身就要 0.3 秒左右)
+HAS_NUMBA = importlib.util.find_spec("numba") is not None
+# 少于这么多根K线时纯 Python 循环只要几十毫秒, 比加载 numba 编译结果还快
+JIT_MIN_BARS = 100000
+
+
+# 所有策略共用的回测内核
+#
+# 每天的流程都一样:
+#     total_asset[t] = total_asset[t-1] + con_num[t-1] * 10 * (price[t] - price[t-1])
+#     con_num[t] = 仓位规则(total_asset[t], ...)
+# 不同的只是仓位规则, 所以规则以函数的形式传进来:
+#     size(t, total, prev_con, params, aux, st) -> 当天合约数
+#         t: 第几天
+#         total: 当天总资金
+#         prev_con: 前一天合约数
+#         params: 规则参数 (float数组)
+#         aux: 每天的辅助序列, aux[k][t] (ATR, 均线信号等)
+#         st: 规则自己的状态 (float数组, 可原地修改)
+# 同一个规则再给一个向量版 size_vec, 参数和返回值都是 (B,) 数组, 供 backtest_batch
+# 把 B 组参数 / B 条价格路径放在一起同步推进
+
+
+class SizingRule:
+    '''
+    :param name: str, 规则名
+    :param size: function, 见上面的 size(...)
+    :param init: function, init(C) -> (第一天合约数, params, st)
+    :param aux: array, 每天的辅助序列, shape = (k, 天数) 或 (k, 天数, B); 没有则为 None
+    :param size_vec: function, size 的向量版, 没有则不能用 backtest_batch
+    '''
+
+    def __init__(self, name, size, init, aux=None, size_vec=None):
+        self.name = name
+        self.size = size
+        self.init = init
+        self.aux = aux
+        self.size_vec = size_vec
+
+    def __repr__(self):
+        return f"SizingRule({self.name!r})"
+
+
+# 仓位规则
+def _size_fixed_fractional(t, total, prev_con, params, aux, st):
+    return int(total * params[0] / params[1])
+
+
+def _size_fixed_ratio(t, total, prev_con, params, aux, st):
+    C = params[0]
+    if total - C < 0:
+        return 1
+    return int(0.5 * (1 + math.sqrt(1 + 8 * (total - C) / params[1])))
+
+
+def _size_volatility_ratio(t, total, prev_con, params, aux, st):
+    return int((total * params[0]) / (aux[0][t] * params[1]))
+
+
+def _size_diminishing_f(t, total, prev_con, params, aux, st):
+    # params = [f, loss_limit, C, m, 档位上限 * m, f的递减值 * (m+1)]
+    C = params[2]
+    m = int(params[3])
+    k = 0
+    while k < m and total > params[4 + k] * C:
+        k += 1
+    return int(total * (params[0] - params[4 + m + k]) / params[1])
+
+
+def _size_equity_curve(t, total, prev_con, params, aux, st):
+    # st = [窗口内资金之和, 已记录天数, 最近w天资金...]
+    w = int(params[2])
+    slot = int(st[1]) % w
+    st[0] += total - st[2 + slot]
+    st[2 + slot] = total
+    st[1] += 1
+    if st[1] >= w:
+        ave = st[0] / w
+    else:
+        ave = total
+    if ave > total:
+        return 0
+    return int(total * params[0] / params[1])
+
+
+def _size_ma_crossover(t, total, prev_con, params, aux, st):
+    # aux[0]: 1 上穿做多, -1 下穿平仓, 0 维持
+    s = aux[0][t]
+    if s > 0:
+        return int(total * params[0] / params[1])
+    if s < 0:
+        return 0
+    return prev_con
+
+
+# 仓位规则 (向量版)
+def _size_fixed_fractional_vec(t, total, prev_con, params, aux, st):
+    return np.trunc(total * params[0] / params[1])
+
+
+def _size_fixed_ratio_vec(t, total, prev_con, params, aux, st):
+    C = params[0]
+    gain = np.maximum(total - C, 0)
+    return np.where(total - C < 0, 1.0, np.trunc(0.5 * (1 + np.sqrt(1 + 8 * gain / params[1]))))
+
+
+def _size_volatility_ratio_vec(t, total, prev_con, params, aux, st):
+    return np.trunc((total * params[0]) / (aux[0][t] * params[1]))
+
+
+def _size_diminishing_f_vec(t, total, prev_con, params, aux, st):
+    C = params[2]
+    m = int(params[3])
+    bounds = np.asarray(params[4:4 + m])
+    decrements = np.asarray(params[4 + m:5 + 2 * m])
+    if bounds.ndim == 1:
+        k = np.searchsorted(bounds, total / C, side="left")  # 第一个 total <= bound * C 的档位
+        return np.trunc(total * (params[0] - decrements[k]) / params[1])
+    # 每组一张档位表: bounds (m, B), decrements (m+1, B); 各列分别查档位
+    k = (total / C > bounds).sum(axis=0)
+    dec = np.take_along_axis(decrements, k[None], axis=0)[0]
+    return np.trunc(total * (params[0] - dec) / params[1])
+
+
+def _size_equity_curve_vec(t, total, prev_con, params, aux, st):
+    w = int(params[2])
+    count = int(st[1][0])
+    slot = count % w
+    st[0] += total - st[2 + slot]
+    st[2 + slot] = total
+    st[1] += 1
+    ave = st[0] / w if count + 1 >= w else total
+    return np.where(ave > total, 0.0, np.trunc(total * params[0] / params[1]))
+
+
+def _size_ma_crossover_vec(t, total, prev_con, params, aux, st):
+    s = aux[0][t]
+    return np.where(s > 0, np.trunc(total * params[0] / params[1]), np.where(s < 0, 0.0, prev_con))
+
+
+def fixed_fractional(f, loss_limit):
+    '''
+    固定分数法: 合约数 = int(总资金 * f / loss_limit)
+    '''
+    def init(C):
+        return np.trunc(C * f / loss_limit), (f, loss_limit), ()
+    return SizingRule("fixed_fractional", _size_fixed_fractional, init,
+                      size_vec=_size_fixed_fractional_vec)
+
+
+def fixed_ratio(delta):
+    '''
+    固定比例法: 平均每份合约盈利 delta 时加一份合约, 亏损时保持1份
+    '''
+    def init(C):
+        return 1, (C, delta), ()
+    return SizingRule("fixed_ratio", _size_fixed_ratio, init, size_vec=_size_fixed_ratio_vec)
+
+
+def volatility_ratio(atr, vol, vp):
+    '''
+    波动比例法: 合约数 = int(总资金 * vol / (ATR * vp))
+    :param atr: array, 每天的ATR; 多条价格路径时为 (天数, 路径数)
+    '''
+    atr = np.asarray(atr, dtype=np.float64)
+
+    def init(C):
+        return np.trunc((C * vol) / (atr[0] * vp)), (vol, vp), ()
+    return SizingRule("volatility_ratio", _size_volatility_ratio, init, aux=atr[None],
+                      size_vec=_size_volatility_ratio_vec)
+
+
+def diminishing_f(f, loss_limit, bounds=(3, 4, 8), decrements=(0.025, 0.05, 0.075, 0.0875)):
+    '''
+    递减f值法: 总资金 <= bounds[k] * C 时, 风险比例取 f - decrements[k]; 超过最高档取最后一个
+    第一天按 f 本身开仓
+    bounds / decrements 也可以是 (m, B) / (m+1, B), 每列一张档位表, 只能用 backtest_batch
+    '''
+    if len(decrements) != len(bounds) + 1:
+        raise ValueError("decrements must have one more entry than bounds")
+
+    def init(C):
+        params = (f, loss_limit, C, len(bounds)) + tuple(bounds) + tuple(decrements)
+        return np.trunc(C * f / loss_limit), params, ()
+    return SizingRule("diminishing_f", _size_diminishing_f, init, size_vec=_size_diminishing_f_vec)
+
+
+def equity_curve(f, loss_limit, window=30):
+    '''
+    净值曲线交易: 固定分数法, 但总资金低于最近 window 天均值时停止交易
+    '''
+    def init(C):
+        st = np.zeros(window + 2)
+        st[0], st[1], st[2] = C, 1, C  # 第一天的资金
+        return np.trunc(C * f / loss_limit), (f, loss_limit, window), st
+    return SizingRule("equity_curve", _size_equity_curve, init, size_vec=_size_equity_curve_vec)
+
+
+# 净值曲线过滤, 套在任何规则外面
+# params 在原规则的参数后面再加4个: 过滤方式 (0 sma / 1 ema / 2 drawdown), 窗口, 回撤阈值, 状态起点 o
+# st 在原规则的状态后面再加:
+#     st[o]: 原规则自己上一天的合约数 (过滤时实际合约数是 0, 原规则照常推进)
+#     st[o+1]: 窗口内资金之和 (sma) / EMA (ema)
+#     st[o+2]: 已记录天数
+#     st[o+3:]: 最近 window 天资金 (sma, drawdown 用)
+# 停止交易后资金不变, sma 和 drawdown (最近 window 天的最高点) 最多 window 天后恢复;
+# EMA 只会无限接近不变的资金, 差距小到浮点误差时直接取资金, 否则会一直停着
+_FILTER_KINDS = {"sma": 0, "ema": 1, "drawdown": 2}
+
+
+def _filter_size(inner):
+    def size(t, total, prev_con, params, aux, st):
+        kind = int(params[-4])
+        w = int(params[-3])
+        o = int(params[-1])
+        con = inner(t, total, st[o], params, aux, st)
+        st[o] = con
+        if kind == 0:
+            slot = int(st[o + 2]) % w
+            st[o + 1] += total - st[o + 3 + slot]
+            st[o + 3 + slot] = total
+            st[o + 2] += 1
+            ave = st[o + 1] / w if st[o + 2] >= w else total
+            allowed = ave <= total
+        elif kind == 1:
+            st[o + 1] += 2.0 / (w + 1) * (total - st[o + 1])
+            if abs(st[o + 1] - total) <= 1e-9 * abs(total):
+                st[o + 1] = total
+            allowed = st[o + 1] <= total
+        else:
+            slot = int(st[o + 2]) % w
+            st[o + 3 + slot] = total
+            st[o + 2] += 1
+            peak = st[o + 3]
+            for k in range(1, w):
+                peak = max(peak, st[o + 3 + k])
+            allowed = peak - total <= params[-2] * peak
+        if allowed:
+            return con
+        return 0
+    return size
+
+
+def _filter_size_vec(inner):
+    def size(t, total, prev_con, params, aux, st):
+        kind = int(params[-4])
+        w = params[-3]
+        o = int(params[-1])
+        con = inner(t, total, st[o], params, aux, st)
+        st[o] = con
+        if kind == 1:
+            st[o + 1] += 2.0 / (w + 1) * (total - st[o + 1])
+            st[o + 1] = np.where(np.abs(st[o + 1] - total) <= 1e-9 * np.abs(total), total, st[o + 1])
+            return np.where(st[o + 1] <= total, con, 0.0)
+        # 各组窗口可以不同, 共用同一个已记录天数
+        count = int(st[o + 2][0])
+        slot = np.asarray(count % w, dtype=np.intp)
+        cols = np.arange(st.shape[1])
+        buf = st[o + 3:]
+        if kind == 0:
+            st[o + 1] += total - buf[slot, cols]
+        buf[slot, cols] = total
+        st[o + 2] += 1
+        if kind == 0:
+            allowed = np.where(count + 1 >= w, st[o + 1] / w, total) <= total
+        else:
+            peak = buf.max(axis=0)  # 窗口以外的行是 -inf
+            allowed = peak - total <= params[-2] * peak
+        return np.where(allowed, con, 0.0)
+    return size
+
+
+class _FilterSize:
+    '''
+    equity_filter 的 size / size_vec: 模块级的类, 只保存原规则的 size 和过滤参数, 可以 pickle
+    (StreamingBacktest.save); 每天的计算在 _filter_size / _filter_size_vec 生成的函数里, 过滤参数从 params 读
+    numba 用 jit_build(已编译的 jit_inner) 生成同样的函数再编译
+
+    :param inner: 原规则的 size (或 size_vec)
+    :param vec: True 时是 size_vec, 每个参数是 (B,) 数组
+    '''
+
+    jit_build = staticmethod(_filter_size)
+
+    def __init__(self, inner, kind, window, threshold, vec=False):
+        self.inner = inner
+        self.kind = kind
+        self.window = window
+        self.threshold = threshold
+        self.vec = vec
+        self._step = None
+
+    @property
+    def jit_inner(self):
+        return self.inner
+
+    def __call__(self, t, total, prev_con, params, aux, st):
+        if self._step is None:
+            self._step = (_filter_size_vec if self.vec else _filter_size)(self.inner)
+        return self._step(t, total, prev_con, params, aux, st)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_step"] = None  # 闭包不能 pickle, 读回来以后再生成
+        return state
+
+    def __repr__(self):
+        return f"_FilterSize({getattr(self.inner, '__name__', self.inner)}, {self.kind}, window={self.window})"
+
+
+def equity_filter(rule, window=30, kind="sma", threshold=0.1):
+    '''
+    净值曲线过滤: 总资金低于最近 window 天均线 (或从最高点回撤超过 threshold) 时停止交易, 其他时候用 rule 的合约数
+    rule 每天照常推进 (用它自己上一天的合约数), 过滤解除后直接接上; 均线逐天增量更新
+    equity_filter(fixed_fractional(f, loss_limit), 30) 与 equity_curve(f, loss_limit, 30) 结果相同
+
+    :param rule: SizingRule, 任何仓位规则, e.g. volatility_ratio / fixed_ratio / diminishing_f / ma_crossover
+    :param window: 均线天数; 也可以是 (B,) 数组, 用 backtest_batch 一次算多个窗口
+    :param kind: "sma" 简单均线 / "ema" 指数均线, alpha = 2 / (window + 1) /
+        "drawdown" 从最近 window 天的最高点回撤超过 threshold
+    :param threshold: kind="drawdown" 时允许的最大回撤比例, 也可以是 (B,) 数组
+    '''
+    if kind not in _FILTER_KINDS:
+        raise ValueError(f"unknown filter kind {kind!r}, choose from {', '.join(_FILTER_KINDS)}")
+    window_max = int(np.max(window))
+    if window_max < 1:
+        raise ValueError("window must be at least 1")
+
+    def init(C):
+        con0, params, st = rule.init(C)
+        st = np.asarray(st, dtype=np.float64)
+        o = len(st)
+        shape = np.broadcast_shapes(np.shape(C), np.shape(con0), np.shape(window), np.shape(threshold),
+                                    *[np.shape(p) for p in params])
+        own = np.zeros((3 + (window_max if kind != "ema" else 0),) + shape)
+        own[0], own[1], own[2] = con0, C, 1
+        if kind == "sma":
+            own[3] = C  # 第一天的资金
+        elif kind == "drawdown":
+            own[3:] = C  # 不满 window 天时最高点按第一天的资金算
+            if own.ndim > 1:
+                # 窗口比最大窗口短的组, 多出来的行不参与取最高点
+                rows = np.arange(window_max)[:, None]
+                own[3:][rows >= np.broadcast_to(window, shape)] = -np.inf
+        if own.ndim > 1 and st.ndim == 1:
+            st = np.repeat(st.reshape(o, 1), own.shape[1], axis=1)  # 每组一份状态
+        params = tuple(params) + (_FILTER_KINDS[kind], window, threshold, o)
+        return con0, params, np.concatenate([st.reshape((o,) + own.shape[1:]), own])
+
+    size = _FilterSize(rule.size, kind, window, threshold)
+    size_vec = None if rule.size_vec is None else _FilterSize(rule.size_vec, kind, window, threshold, vec=True)
+    return SizingRule(f"equity_filter({rule.name}, {kind})", size, init, aux=rule.aux, size_vec=size_vec)
+
+
+def _filter_ema_loop(total, alpha):
+    out = np.empty(len(total))
+    ema = total[0]
+    for t in range(len(total)):
+        if t > 0:
+            ema += alpha * (total[t] - ema)
+            if abs(ema - total[t]) <= 1e-9 * abs(total[t]):
+                ema = total[t]
+        out[t] = ema
+    return out
+
+
+def filter_ema(total_asset, window, use_jit=None):
+    '''
+    equity_filter(kind="ema") 过滤用的资金 EMA, 与过滤里逐天更新的值完全相同 (包括贴近资金时直接取资金)
+    资金低于这条线的第二天合约数为 0
+
+    :param total_asset: array, 回测的 Total_asset, 第一天是初始资金
+    :param window: 均线天数, alpha = 2 / (window + 1)
+    :param use_jit: 同 backtest_arrays
+    :return: np.ndarray
+    '''
+    total = np.ascontiguousarray(total_asset, dtype=np.float64)
+    if len(total) == 0:
+        return total.copy()
+    if use_jit is None:
+        use_jit = HAS_NUMBA and len(total) >= JIT_MIN_BARS
+    if use_jit:
+        return _jitted(_filter_ema_loop)(total, 2.0 / (window + 1))
+    return _filter_ema_loop(total, 2.0 / (window + 1))
+
+
+def crossover_signal(sma, fma):
+    '''
+    :param sma: Slow moving average
+    :param fma: Fast moving average
+    :return: np.ndarray, 1 上穿做多, -1 下穿平仓, 0 维持 (与原 backtest_df 的判断一致)
+    '''
+    sma = np.asarray(sma, dtype=np.float64)
+    fma = np.asarray(fma, dtype=np.float64)
+    sig = np.zeros(sma.shape)
+    prev_s, prev_f, s = sma[:-1], fma[:-1], sma[1:]
+    sig[1:] = np.where((prev_s > prev_f) & (s < prev_f), 1.0,
+                       np.where((prev_s < prev_f) & (s > prev_f), -1.0, 0.0))
+    return sig
+
+
+def ma_crossover(sma, fma, f, loss_limit, signal=None):
+    '''
+    移动均线交叉策略: 上穿时按固定分数法开仓, 下穿时平仓, 其他时间维持仓位
+    :param signal: 已经算好的 crossover_signal(sma, fma), 扫描参数时复用
+    '''
+    sig = crossover_signal(sma, fma) if signal is None else np.asarray(signal, dtype=np.float64)
+
+    def init(C):
+        return np.trunc(C * f / loss_limit), (f, loss_limit), ()
+    return SizingRule("ma_crossover", _size_ma_crossover, init, aux=sig[None],
+                      size_vec=_size_ma_crossover_vec)
+
+
+# Backtest loop
+def _loop(price, con0, C, size, params, aux, st, multiplier):
+    n = len(price)
+    total = [0.0] * n
+    con = [0.0] * n
+    total[0] = C
+    con[0] = con0
+    for t in range(1, n):
+        total[t] = total[t - 1] + con[t - 1] * multiplier * (price[t] - price[t - 1])
+        con[t] = size(t, total[t], con[t - 1], params, aux, st)
+    return con, total
+
+
+def _loop_arrays(price, con0, C, size, params, aux, st, multiplier):
+    n = len(price)
+    total = np.empty(n)
+    con = np.empty(n)
+    total[0] = C
+    con[0] = con0
+    for t in range(1, n):
+        total[t] = total[t - 1] + con[t - 1] * multiplier * (price[t] - price[t - 1])
+        con[t] = size(t, total[t], con[t - 1], params, aux, st)
+    return con, total
+
+
+_jit_cache = {}
+
+
+def _jit_key(func):
+    # equity_filter 每次调用都生成新的 _FilterSize, 按 (包装方式, 原规则) 缓存, 同一个原规则的包装只编译一次
+    if hasattr(func, "jit_build"):
+        return func.jit_build, _jit_key(func.jit_inner)
+    return func
+
+
+def _jitted(func):
+    key = _jit_key(func)
+    if key not in _jit_cache:
+        from numba import njit
+        if hasattr(func, "jit_build"):  # 包装别的规则的闭包不能缓存到磁盘
+            _jit_cache[key] = njit(func.jit_build(_jitted(func.jit_inner)))
+        else:
+            _jit_cache[key] = njit(cache=True)(func)
+    return _jit_cache[key]
+
+
+@traced()
+def backtest_arrays(price, C, rule, guarantee, multiplier=10, use_jit=None):
+    '''
+    :param price: array, 每天收盘价
+    :param C: 初始资金
+    :param rule: SizingRule, 仓位规则
+    :param guarantee: 保证金比例
+    :param multiplier: 每手合约的吨数 (螺纹钢 10吨/手)
+    :param use_jit: None 有numba且不少于 JIT_MIN_BARS 根K线时用; True 必须用numba; False 纯Python
+    :return: (contract_number, Total_asset, Used_asset, Lever_ratio), 都是 np.ndarray
+    '''
+    price = np.ascontiguousarray(price, dtype=np.float64)
+    n = len(price)
+    con0, params, st = rule.init(C)
+    params = np.asarray(params, dtype=np.float64)
+    st = np.array(st, dtype=np.float64)
+    aux = np.zeros((0, n)) if rule.aux is None else np.ascontiguousarray(rule.aux, dtype=np.float64)
+
+    if use_jit is None:
+        use_jit = HAS_NUMBA and n >= JIT_MIN_BARS
+    if use_jit and not HAS_NUMBA:
+        raise ImportError("use_jit=True requires numba")
+
+    if n == 0:
+        con_num = total_asset = np.empty(0)
+    elif use_jit:
+        con_num, total_asset = _jitted(_loop_arrays)(
+            price, float(con0), float(C), _jitted(rule.size), params, aux, st, float(multiplier))
+    else:
+        con_num, total_asset = _loop(price.tolist(), float(con0), float(C), rule.size,
+                                     params.tolist(), aux.tolist(), st.tolist(), multiplier)
+        con_num = np.asarray(con_num, dtype=np.float64)
+        total_asset = np.asarray(total_asset, dtype=np.float64)
+
+    used_asset = con_num * multiplier * price * guarantee / total_asset  # 占用资金
+    lever_ratio = con_num * multiplier * price / total_asset  # 杠杆率
+    return con_num, total_asset, used_asset, lever_ratio
+
+
+def backtest_continue(price, prev_price, prev_con, prev_total, size, params, aux, st, multiplier=10,
+                      use_jit=None):
+    '''
+    接着上一段继续回测 (分块读入的长历史): 从上一段最后一天的价格、合约数、资金接着算
+    本段第 0 天: Total_asset = prev_total + prev_con * multiplier * (price[0] - prev_price)
+
+    :param price: array, 本段每天的收盘价
+    :param size: rule.size
+    :param params: np.ndarray, rule.init 返回的参数
+    :param aux: np.ndarray, (k, 本段天数), 本段的辅助序列
+    :param st: np.ndarray, 规则状态, 原地更新, 下一段接着传入
+    :param use_jit: 见 backtest_arrays
+    :return: (contract_number, Total_asset), 本段每天的值
+    '''
+    # 前面补上一段的最后一天, 直接复用整段回测的循环
+    price = np.concatenate([[float(prev_price)], np.asarray(price, dtype=np.float64)])
+    aux = np.asarray(aux, dtype=np.float64).reshape(len(aux), len(price) - 1)
+    aux = np.concatenate([np.zeros((len(aux), 1)), aux], axis=1)
+    if use_jit is None:
+        use_jit = HAS_NUMBA and len(price) >= JIT_MIN_BARS
+    if use_jit and not HAS_NUMBA:
+        raise ImportError("use_jit=True requires numba")
+
+    if use_jit:
+        con_num, total_asset = _jitted(_loop_arrays)(
+            price, float(prev_con), float(prev_total), _jitted(size), params, aux, st, float(multiplier))
+    else:
+        st_list = st.tolist()
+        con_num, total_asset = _loop(price.tolist(), float(prev_con), float(prev_total), size,
+                                     params.tolist(), aux.tolist(), st_list, multiplier)
+        st[:] = st_list
+        con_num = np.asarray(con_num, dtype=np.float64)
+        total_asset = np.asarray(total_asset, dtype=np.float64)
+    return con_num[1:], total_asset[1:]
+
+
+class BacktestResult:
+    '''
+    一次回测的结果: 每列一个连续数组; 输入的 df 只保存引用, 不复制也不往里加列
+    result["Total_asset"] 直接取数组, 需要 DataFrame 时再 to_frame()
+
+    :param df: 回测用的 DataFrame (时间, 收盘价(元), ...)
+    :param columns: Dict[str, np.ndarray], 结果列, 顺序就是 to_frame 里的顺序
+    '''
+
+    def __init__(self, df, columns):
+        self.df = df
+        self.columns = columns
+
+    def __getitem__(self, key):
+        if key in self.columns:
+            return self.columns[key]
+        return self.df[key].to_numpy()
+
+    def __contains__(self, key):
+        return key in self.columns or key in self.df
+
+    # 有 __getitem__ 但不是序列: 放进 DataFrame / Series 时当成一个值, 不逐个下标去取
+    __iter__ = None
+
+    @property
+    def n_bars(self):
+        return len(self.df)
+
+    def __repr__(self):
+        return f"BacktestResult({self.n_bars} bars, {list(self.columns)})"
+
+    @property
+    def nbytes(self):
+        return sum(v.nbytes for v in self.columns.values())
+
+    def to_frame(self):
+        '''
+        :return: 新的 DataFrame, df 原有的列 + 结果列 (与以前 backtest_df 返回的一样)
+        '''
+        import pandas as pd
+
+        data = {c: self.df[c].to_numpy() for c in self.df.columns}
+        data.update(self.columns)
+        return pd.DataFrame(data, index=self.df.index, copy=False)
+
+
+def backtest_result(df, C, rule, guarantee, con_dtype=np.int32, dtype=np.float64, multiplier=10):
+    '''
+    用 df["收盘价(元)"] 回测, 结果放进 BacktestResult
+
+    :param con_dtype: 合约数的类型, 默认 int32
+    :param dtype: 资金/比例的类型, np.float32 可以省一半内存
+    :return: BacktestResult, 列为 contract_number, Total_asset, Used_asset, Lever_ratio
+    '''
+    con_num, total_asset, used_asset, lever_ratio = backtest_arrays(
+        df["收盘价(元)"].to_numpy(), C, rule, guarantee, multiplier)
+    return BacktestResult(df, {
+        "contract_number": con_num.astype(con_dtype),
+        "Total_asset": total_asset.astype(dtype, copy=False),
+        "Used_asset": used_asset.astype(dtype, copy=False),
+        "Lever_ratio": lever_ratio.astype(dtype, copy=False),
+    })
+
+
+class PositionLedger:
+    '''
+    只记录仓位变化的回测结果: 合约数变化的那一天 (以及第 0 天) 记一条 (第几天, 新合约数, 当天资金)
+    均线交叉这种很少换仓的策略, 几千天只有几十条, 扫描几千组参数时每组都能完整保留
+    contract_number / Total_asset / Used_asset / Lever_ratio 用到时再从价格重建:
+        两次换仓之间合约数不变, Total_asset[t] = 资金[换仓日] + 合约数 * multiplier * (price[t] - price[换仓日])
+
+    :param price: array, 每天收盘价, 只保存引用 (扫描时所有结果共用一份)
+    :param index: array, 换仓的天 (第一个是 0)
+    :param contracts: array, 换仓后的合约数
+    :param equity: array, 换仓那天的总资金
+    :param guarantee: 保证金比例
+    :param df: 回测用的 DataFrame, 只在 to_result / to_frame 时用; 可选
+    '''
+
+    columns = ("contract_number", "Total_asset", "Used_asset", "Lever_ratio")
+
+    def __init__(self, price, index, contracts, equity, guarantee, multiplier=10, df=None):
+        self.price = np.asarray(price, dtype=np.float64)
+        self.index = index
+        self.contracts = contracts
+        self.equity = equity
+        self.guarantee = guarantee
+        self.multiplier = multiplier
+        self.df = df
+
+    @classmethod
+    def from_arrays(cls, price, con_num, total_asset, guarantee, multiplier=10, df=None, con_dtype=np.int32):
+        '''
+        :param con_num: (天数,) 或 (天数, B), backtest_arrays / backtest_batch 的结果
+        :param total_asset: 与 con_num 同形状
+        :return: PositionLedger; 二维输入时返回 List[PositionLedger], 每列一个
+        '''
+        con_num = np.asarray(con_num)
+        total_asset = np.asarray(total_asset)
+        n = len(con_num)
+        index_dtype = np.int32 if n < 2 ** 31 else np.int64
+        changed = np.ones(con_num.shape, dtype=bool)
+        changed[1:] = con_num[1:] != con_num[:-1]
+        if con_num.ndim == 1:
+            idx = np.flatnonzero(changed)
+            return cls(price, idx.astype(index_dtype), con_num[idx].astype(con_dtype),
+                       total_asset[idx].astype(np.float64), guarantee, multiplier, df)
+        ledgers = []
+        for j in range(con_num.shape[1]):
+            idx = np.flatnonzero(changed[:, j])
+            ledgers.append(cls(price, idx.astype(index_dtype), con_num[idx, j].astype(con_dtype),
+                               total_asset[idx, j].astype(np.float64), guarantee, multiplier, df))
+        return ledgers
+
+    __iter__ = None  # 同 BacktestResult, 放进扫描结果的 ledger 列时当成一个值
+
+    @property
+    def n_bars(self):
+        return len(self.price)
+
+    def __repr__(self):
+        return f"PositionLedger({self.n_bars} bars, {len(self.index)} position changes)"
+
+    @property
+    def nbytes(self):
+        '''
+        只算换仓记录, 不算共用的价格
+        '''
+        return self.index.nbytes + self.contracts.nbytes + self.equity.nbytes
+
+    @property
+    def final_equity(self):
+        last = self.index[-1]
+        return float(self.equity[-1] + self.contracts[-1] * self.multiplier * (self.price[-1] - self.price[last]))
+
+    def _segment(self):
+        # 每天属于第几段 (最近一次换仓)
+        lengths = np.diff(np.append(self.index, len(self.price)))
+        return np.repeat(np.arange(len(self.index)), lengths)
+
+    def __getitem__(self, key):
+        if key not in self.columns:
+            if self.df is not None:
+                return self.df[key].to_numpy()
+            raise KeyError(key)
+        k = self._segment()
+        con_num = self.contracts[k]
+        if key == "contract_number":
+            return con_num
+        start = self.index[k]
+        total_asset = self.equity[k] + con_num * self.multiplier * (self.price - self.price[start])
+        if key == "Total_asset":
+            return total_asset
+        lever_ratio = con_num * self.multiplier * self.price / total_asset
+        if key == "Lever_ratio":
+            return lever_ratio
+        return lever_ratio * self.guarantee
+
+    def events(self):
+        '''
+        :return: DataFrame, 每次换仓一行
+            bar    (时间)    contract_number    Total_asset
+        '''
+        import pandas as pd
+
+        events = pd.DataFrame({"bar": self.index, "contract_number": self.contracts, "Total_asset": self.equity})
+        if self.df is not None and "时间" in self.df:
+            events.insert(1, "时间", self.df["时间"].to_numpy()[self.index])
+        return events
+
+    def to_result(self, df=None, dtype=np.float64):
+        '''
+        :return: BacktestResult, 四列都重建出来
+        '''
+        df = self.df if df is None else df
+        return BacktestResult(df, {c: self[c] if c == "contract_number" else self[c].astype(dtype, copy=False)
+                                   for c in self.columns})
+
+    def to_frame(self, df=None):
+        return self.to_result(df).to_frame()
+
+
+def ledger_result(df, C, rule, guarantee, multiplier=10):
+    '''
+    与 backtest_result 相同, 结果只保留换仓记录
+    :return: PositionLedger
+    '''
+    price = df["收盘价(元)"].to_numpy()
+    con_num, total_asset, _, _ = backtest_arrays(price, C, rule, guarantee, multiplier)
+    return PositionLedger.from_arrays(price, con_num, total_asset, guarantee, multiplier, df)
+
+
+@traced()
+def backtest_batch(price, C, rule, guarantee, multiplier=10, keep_paths=True):
+    '''
+    B 组回测同步推进: 时间上逐天循环, 每一天对 B 组一起做向量运算
+
+    :param price: array, (天数,) 所有组共用一条价格; 或 (天数, B) 每组一条价格路径
+    :param C: 初始资金, 标量或 (B,)
+    :param rule: SizingRule, 参数可以是 (B,) 数组, 例如一组 f 或 delta
+    :param guarantee: 保证金比例
+    :param keep_paths: True 返回每天的数组; False 只保留汇总, 内存与天数无关
+    :return:
+        keep_paths=True: (contract_number, Total_asset, Used_asset, Lever_ratio), 都是 (天数, B)
+        keep_paths=False: dict, final_equity / min_equity / max_drawdown / max_lever, 都是 (B,)
+    '''
+    if rule.size_vec is None:
+        raise ValueError(f"{rule.name} has no vectorized size function")
+    price = np.asarray(price, dtype=np.float64)
+    n = len(price)
+    con0, params, st = rule.init(C)
+    aux = () if rule.aux is None else np.asarray(rule.aux, dtype=np.float64)
+
+    shape = np.broadcast_shapes(np.shape(C), np.shape(con0), price.shape[1:],
+                                *[np.shape(p) for p in params],
+                                *([aux.shape[2:]] if len(aux) else []))
+    B = int(np.prod(shape))
+    st = np.array(st, dtype=np.float64)
+    if st.ndim == 1:
+        st = np.repeat(st[:, None], B, axis=1)  # 每组一份状态
+    p = price.reshape(n, -1)
+
+    total = np.broadcast_to(np.asarray(C, dtype=np.float64), (B,)).copy()
+    con = np.broadcast_to(np.asarray(con0, dtype=np.float64), (B,)).copy()
+    lever = con * multiplier * p[0] / total
+    if keep_paths:
+        con_num = np.empty((n, B))
+        total_asset = np.empty((n, B))
+        lever_ratio = np.empty((n, B))
+        con_num[0], total_asset[0], lever_ratio[0] = con, total, lever
+    else:
+        peak = total.copy()
+        min_equity = total.copy()
+        max_dd = np.zeros(B)
+        max_lever = lever.copy()
+
+    for t in range(1, n):
+        total = total + con * multiplier * (p[t] - p[t - 1])
+        con = np.broadcast_to(rule.size_vec(t, total, con, params, aux, st), (B,))
+        lever = con * multiplier * p[t] / total
+        if keep_paths:
+            con_num[t], total_asset[t], lever_ratio[t] = con, total, lever
+        else:
+            np.maximum(peak, total, out=peak)
+            np.minimum(min_equity, total, out=min_equity)
+            np.maximum(max_dd, (peak - total) / peak, out=max_dd)
+            np.maximum(max_lever, lever, out=max_lever)
+
+    if keep_paths:
+        used_asset = con_num * multiplier * p * guarantee / total_asset
+        return con_num, total_asset, used_asset, lever_ratio
+    return {"final_equity": total, "min_equity": min_equity,
+            "max_drawdown": max_dd, "max_lever": max_lever}
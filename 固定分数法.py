@@ -1,8 +1,8 @@
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from datetime import datetime
+
+from 回测内核 import backtest_result, fixed_fractional
+from 数据加载 import load_columns
+from 报告 import asset_report
 
 
 def read_data(path):
@@ -13,12 +13,10 @@ def read_data(path):
     ...         ...
     ...         ...
     '''
-    source_df = pd.read_excel(path)
-    df = source_df[["时间", "收盘价(元)"]]
-    return df
+    return load_columns(path, ["时间", "收盘价(元)"])  # 第一次之后走缓存
 
 
-def backtest_df(df, C, f, loss_limit, guarantee):
+def backtest(df, C, f, loss_limit, guarantee, con_dtype=np.int32, dtype=np.float64):
     '''
     :param df:
         日期      收盘价(元)
@@ -27,42 +25,36 @@ def backtest_df(df, C, f, loss_limit, guarantee):
     :param C: 初始资金
     :param loss_limit: 每份合约允许的最大亏损额
     :param guarantee: 保证金比例
-    :return:
+    :param con_dtype: 合约数的类型
+    :param dtype: 资金/比例的类型, np.float32 可以省一半内存
+    :return: BacktestResult, 结果列放在各自的数组里, 不修改 df; 要 DataFrame 用 backtest_df
+    '''
+    return backtest_result(df, C, fixed_fractional(f, loss_limit), guarantee, con_dtype, dtype)
+
+
+def backtest_df(df, C, f, loss_limit, guarantee):
+    '''
+    与 backtest 相同, 结果转成 DataFrame
+    :return: 新的 DataFrame, df 本身不变
         日期      收盘价(元)      contract_number     Total_asset     Used_asset
         ...         ...         ...                 ...             ...
         ...         ...         ...                 ...             ...
     '''
-    total_asset = C * np.ones(len(df))  # 总资金 at day1
-    con_num = int(C * f / loss_limit) * np.ones(len(df))  # 合约数 at day1
-    used_asset = (int(C * f / loss_limit) * 10 *
-                  df["收盘价(元)"][0] * guarantee / C) * np.ones(len(df))  # 占用资金 at day1
-    lever_ratio = (int(C * f / loss_limit) * 10 *
-                   df["收盘价(元)"][0] / C) * np.ones(len(df))
-
-    for index in range(1, len(df)):
-        # Total asset
-        total = con_num[index - 1] * 10 * (df["收盘价(元)"][index] - df["收盘价(元)"][index - 1])
-        total_asset[index] = total_asset[index - 1] + total
-        # Contract number
-        con_num[index] = int(total_asset[index] * f / loss_limit)
-        # Used asset
-        used_asset[index] = con_num[index] * 10 * df["收盘价(元)"][index] * guarantee / total_asset[index]
-        lever_ratio[index] = con_num[index] * 10 * df["收盘价(元)"][index] / total_asset[index]
-
-    df["contract_number"] = con_num
-    df["Total_asset"] = total_asset
-    df["Used_asset"] = used_asset
-    df["Lever_ratio"] = lever_ratio
-
-    return df
-
-
-def total_asset_plot(x, y, C):
+    return backtest(df, C, f, loss_limit, guarantee).to_frame()
+
+
+def total_asset_plot(x, y, C, path=None):
     '''
     :param x: 图像的x值，一般是日期
     :param y: 图像y值，一般是total asset value
+    :param path: 保存为 .png / .html 文件 (不弹窗口, 曲线降采样); None 则 plt.show()
     :return: None，因为要画图
     '''
+    if path is not None:
+        asset_report(path, x, y, C, "Total asset when using Fixed Fractional")
+        return
+
+    import matplotlib.pyplot as plt  # 只在画图时加载
     fig, ax = plt.subplots()
     ax.plot(x, y)
     # 设置其他参数
@@ -1,9 +1,10 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from datetime import datetime
-import math
+
+from 回测内核 import backtest_batch, backtest_result, fixed_ratio
+from 数据加载 import load_columns
+from 绩效指标 import max_drawdown
+from 报告 import asset_report
 
 
 def read_data(path): # 读取数据
@@ -14,12 +15,10 @@ def read_data(path): # 读取数据
     ...         ...
     ...         ...
     '''
-    source_df = pd.read_excel(path)
-    df = source_df[["时间", "收盘价(元)"]]
-    return df
+    return load_columns(path, ["时间", "收盘价(元)"])  # 第一次之后走缓存
 
 
-def backtest_df(df, C, delta, guarantee): # 进行回测
+def backtest(df, C, delta, guarantee, con_dtype=np.int32, dtype=np.float64): # 进行回测
     '''
     :param df:
         日期      收盘价(元)
@@ -29,46 +28,65 @@ def backtest_df(df, C, delta, guarantee): # 进行回测
     :param num: 初始买入合约数
     :param delta: 当平均每份合约增加\delta的时候，再多买进一份合约
     :param guarantee: 保证金比例
-    :return:
+    :param con_dtype: 合约数的类型
+    :param dtype: 资金/比例的类型, np.float32 可以省一半内存
+    :return: BacktestResult, 结果列放在各自的数组里, 不修改 df; 要 DataFrame 用 backtest_df
+    '''
+    return backtest_result(df, C, fixed_ratio(delta), guarantee, con_dtype, dtype)
+
+
+def backtest_df(df, C, delta, guarantee):
+    '''
+    与 backtest 相同, 结果转成 DataFrame
+    :return: 新的 DataFrame, df 本身不变
         日期      收盘价(元)      contract_number     Total_asset     Used_asset
         ...         ...         ...                 ...             ...
         ...         ...         ...                 ...             ...
     '''
-    total_asset = C * np.ones(len(df))  # 总资金 at day1
-    con_num = np.ones(len(df))  # 合约数 at day1
-    used_asset = 1 * 10 * (
-            df["收盘价(元)"][0] * guarantee) / C * np.zeros(len(df))  # 占用资金 at day1
-    lever_ratio = 1 * 10 * (
-        df["收盘价(元)"][0]) / C * np.zeros(len(df))  # 杠杆率
-
-    for index in range(1, len(df)):
-        # Total asset
-        total = con_num[index - 1] * 10 * (df["收盘价(元)"][index] - df["收盘价(元)"][index - 1])  # 10吨/手
-        total_asset[index] = total_asset[index - 1] + total
-
-        if (total_asset[index] - C < 0):
-            con_num[index] = 1
-        else:
-            con_num[index] = int(0.5 * (1 + math.sqrt(1 + 8 * (total_asset[index] - C) / delta)))
-        # Used asset
-        used_asset[index] = con_num[index] * 10 * df["收盘价(元)"][index] * guarantee / total_asset[index]
+    return backtest(df, C, delta, guarantee).to_frame()
 
-        lever_ratio[index] = con_num[index] * 10 * df["收盘价(元)"][index] / total_asset[index]
 
-    df["contract_number"] = con_num
-    df["Total_asset"] = total_asset
-    df["Used_asset"] = used_asset
-    df["Lever_ratio"] = lever_ratio
-
-    return df
-
-
-def total_asset_plot(x, y, C): # 描述资金变化曲线
+def delta_table(df, C, deltas, guarantee, paths=False):
+    '''
+    一组 delta 一次算完: 所有 delta 的资金/合约数是 (delta个数,) 的数组, 逐天用 NumPy 一起推进,
+    总时间和跑一次单个 delta 的 Python 循环差不多
+
+    :param deltas: array, e.g. np.linspace(5000, 100000, 1000)
+    :param paths: True 时同时返回每天的资金
+    :return: DataFrame, 每个 delta 一行
+        delta    final_equity    min_equity    max_drawdown    max_lever
+        paths=True 时返回 (上面的 DataFrame, 每天资金的 DataFrame: 行是日期 (df 没有"时间"列时用 df.index), 列是 delta)
+    '''
+    deltas = np.atleast_1d(np.asarray(deltas, dtype=np.float64))
+    price = df["收盘价(元)"].to_numpy()
+    if not paths:
+        return pd.DataFrame({"delta": deltas,
+                             **backtest_batch(price, C, fixed_ratio(deltas), guarantee, keep_paths=False)})
+
+    _, total_asset, _, lever_ratio = backtest_batch(price, C, fixed_ratio(deltas), guarantee)
+    table = pd.DataFrame({
+        "delta": deltas,
+        "final_equity": total_asset[-1],
+        "min_equity": total_asset.min(axis=0),
+        "max_drawdown": max_drawdown(total_asset),
+        "max_lever": lever_ratio.max(axis=0),
+    })
+    index = df["时间"] if "时间" in df else df.index
+    return table, pd.DataFrame(total_asset, index=index, columns=deltas)
+
+
+def total_asset_plot(x, y, C, path=None): # 描述资金变化曲线
     '''
     :param x: 图像的x值，一般是日期
     :param y: 图像y值，一般是total asset value
+    :param path: 保存为 .png / .html 文件 (不弹窗口, 曲线降采样); None 则 plt.show()
     :return: None，因为要画图
     '''
+    if path is not None:
+        asset_report(path, x, y, C, "Total asset when using Fixed Fractional")
+        return
+
+    import matplotlib.pyplot as plt  # 只在画图时加载
     fig, ax = plt.subplots()
     ax.plot(x, y)
     # 设置其他参数
@@ -107,9 +125,12 @@ if __name__ == '__main__':
     delta = 20000  # 当平均每份合约增加\delta的时候，再多买进一份合约
     guarantee = 0.16  # 保证金比例
 
+    # delta 敏感度: 1000 个 delta 一起算
+    print(delta_table(df, C, np.linspace(5000, 100000, 1000), guarantee))
+
     final_df = backtest_df(df, C, delta, guarantee)
 
     total_asset_plot(final_df["时间"], final_df["Total_asset"], C)
 
     # print(sum(final_df["contract_number"] == 80.0))
-    print(df)
\ No newline at end of file
+    print(final_df)
\ No newline at end of file
@@ -0,0 +1,194 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+
+# 分阶段计时: 读数据 / 指标 / 回测 / 画图 各用了多少时间和内存
+#     import 性能追踪
+#     性能追踪.enable()
+#     with 性能追踪.stage("backtest", category="fixed_fractional"):
+#         ...
+#     性能追踪.to_json("profile.json")           # 每个阶段一条记录
+#     性能追踪.to_chrome_trace("trace.json")     # chrome://tracing 或 ui.perfetto.dev 打开
+#
+# 常用函数 (load_columns, ma_batch, atr_batch, backtest_arrays, asset_report 等) 已经用 @traced 标好,
+# 没有 enable() 时只多一次全局变量判断; 阶段可以嵌套, 没给 category 的沿用外层的 (一般是策略名)
+# 每个阶段记录: 墙钟时间, 本线程 CPU 时间, 阶段内的内存峰值 (tracemalloc, 只算 Python/NumPy 分配)
+# 只记录本进程, Pool 子进程里的阶段不会收集
+
+ENABLED = False
+_memory = False
+_started_tracemalloc = False  # tracemalloc 是不是 enable() 开的; 外面已经开着的, disable() 不去关
+_records = []
+_lock = threading.Lock()
+_local = threading.local()
+_origin = time.perf_counter()
+
+
+def enable(memory=True):
+    '''
+    :param memory: 是否记录内存峰值; tracemalloc 会让分配内存慢一些, 只要时间时可以关掉
+    '''
+    global ENABLED, _memory, _started_tracemalloc
+    ENABLED = True
+    _memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracemalloc = True
+
+
+def disable():
+    global ENABLED, _memory, _started_tracemalloc
+    ENABLED = False
+    if _started_tracemalloc and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _started_tracemalloc = False
+    _memory = False
+
+
+def reset():
+    '''
+    清空已经记录的阶段
+    '''
+    with _lock:
+        _records.clear()
+
+
+def records():
+    '''
+    :return: List[dict], 按结束顺序, 每个阶段一条:
+        name, category, start (秒, 相对模块导入), wall, cpu (秒), peak_memory (字节, 没开内存记录为 None),
+        depth (嵌套层数), thread, args
+    '''
+    with _lock:
+        return list(_records)
+
+
+class _Stage:
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        parent = stack[-1] if stack else None
+        if self.category is None:
+            self.category = parent.category if parent is not None else "stage"
+        self.depth = len(stack)
+        self.memory = _memory and tracemalloc.is_tracing()
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if parent is not None and parent.memory:
+                parent.max_seen = max(parent.max_seen, peak)  # 外层阶段到现在为止的峰值
+            tracemalloc.reset_peak()
+            self.base = self.max_seen = current
+        stack.append(self)
+        self.start = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.start
+        cpu = time.thread_time() - self.cpu
+        peak = None
+        if self.memory:
+            self.max_seen = max(self.max_seen, tracemalloc.get_traced_memory()[1])
+            peak = self.max_seen - self.base
+        stack = _local.stack
+        stack.pop()
+        if stack and stack[-1].memory and self.memory:
+            stack[-1].max_seen = max(stack[-1].max_seen, self.max_seen)
+        record = {"name": self.name, "category": self.category, "start": self.start - _origin,
+                  "wall": wall, "cpu": cpu, "peak_memory": peak, "depth": self.depth,
+                  "thread": threading.get_ident(), "args": self.args}
+        with _lock:
+            _records.append(record)
+        return False
+
+
+class _NoStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name, category=None, **args):
+    '''
+    :param name: 阶段名, e.g. "read_data" / "indicators" / "backtest" / "plot"
+    :param category: 一般是策略名; None 时沿用外层阶段的
+    :param args: 其他要一起记下来的信息 (要能转成 JSON)
+    :return: context manager; 没有 enable() 时什么都不做
+    '''
+    if not ENABLED:
+        return _NO_STAGE
+    return _Stage(name, category, args)
+
+
+def traced(name=None):
+    '''
+    装饰器: 每次调用记成一个阶段
+    :param name: 阶段名, 默认是函数名
+    '''
+    def decorate(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with _Stage(stage_name, None, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def summary():
+    '''
+    :return: DataFrame, 按 (category, name) 汇总: calls, wall, cpu, peak_memory (最大值)
+    '''
+    import pandas as pd
+
+    df = pd.DataFrame(records(), columns=["name", "category", "wall", "cpu", "peak_memory"])
+    return (df.groupby(["category", "name"], sort=False)
+              .agg(calls=("wall", "size"), wall=("wall", "sum"), cpu=("cpu", "sum"),
+                   peak_memory=("peak_memory", "max"))
+              .sort_values("wall", ascending=False))
+
+
+def to_json(path=None):
+    '''
+    :param path: 写到这个文件; None 只返回字符串
+    :return: str, records() 的 JSON
+    '''
+    text = json.dumps(records(), ensure_ascii=False, indent=1, default=str)
+    if path is not None:
+        with open(path, "w", encoding="utf-8") as fp:
+            fp.write(text)
+    return text
+
+
+def to_chrome_trace(path):
+    '''
+    :param path: 输出文件, Chrome trace 格式 (Trace Event Format, 每个阶段一个 "X" 事件, 时间单位微秒)
+    '''
+    pid = os.getpid()
+    events = []
+    for r in records():
+        args = {"cpu_ms": r["cpu"] * 1e3, **r["args"]}
+        if r["peak_memory"] is not None:
+            args["peak_memory_mb"] = r["peak_memory"] / 2 ** 20
+        events.append({"name": r["name"], "cat": r["category"], "ph": "X", "ts": r["start"] * 1e6,
+                       "dur": r["wall"] * 1e6, "pid": pid, "tid": r["thread"], "args": args})
+    with open(path, "w", encoding="utf-8") as fp:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fp, ensure_ascii=False, default=str)
@@ -0,0 +1,192 @@
+import base64
+import html
+import io
+import os
+from multiprocessing import Pool
+
+import numpy as np
+
+from 性能追踪 import traced
+
+
+# 不弹窗口的报告: 用 Agg 直接画到 PNG / HTML, 曲线先降采样到屏幕分辨率, 几百万根K线也很快
+# 不经过 pyplot, 没有显示器、在子进程里都可以用
+
+
+def minmax_index(y, n_buckets):
+    '''
+    每个桶保留最低点和最高点, 曲线的形状 (包括所有尖峰) 不变
+
+    :param y: array, 曲线
+    :param n_buckets: 桶数, 输出最多 2 * n_buckets + 2 个点
+    :return: np.ndarray, 保留的下标, 升序
+    '''
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n <= 2 * n_buckets + 2:
+        return np.arange(n)
+    # 桶的边界均匀分布, 每个桶至少 2 个点, 桶之间的点数最多差 1
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64).tolist()
+    keep = [0, n - 1]
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        keep.append(lo + int(y[lo:hi].argmin()))
+        keep.append(lo + int(y[lo:hi].argmax()))
+    return np.unique(keep)
+
+
+def lttb_index(y, n_out):
+    '''
+    Largest-Triangle-Three-Buckets: 每个桶选与前一个选中点、后一个桶均值组成的三角形面积最大的点
+
+    :param y: array, 曲线 (横坐标按等间距处理)
+    :param n_out: 输出点数
+    :return: np.ndarray, 保留的下标, 升序
+    '''
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)  # 首尾之间 n_out - 2 个桶
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            cx, cy = (edges[i + 1] + edges[i + 2] - 1) / 2, y[edges[i + 1]:edges[i + 2]].mean()
+        else:
+            cx, cy = n - 1, y[n - 1]
+        xs = np.arange(lo, hi)
+        area = np.abs((a - cx) * (y[lo:hi] - y[a]) - (a - xs) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+
+def downsample(y, n_points=2000, method="minmax"):
+    '''
+    :param y: array, 曲线
+    :param n_points: 大约保留的点数, 一般取图片宽度的像素数左右
+    :param method: "minmax" 或 "lttb"
+    :return: np.ndarray, 保留的下标, 一定包含首尾和全局最高点、最低点
+    '''
+    y = np.asarray(y, dtype=np.float64)
+    if method == "minmax":
+        idx = minmax_index(y, max(n_points // 2, 1))
+    elif method == "lttb":
+        idx = lttb_index(y, n_points)
+    else:
+        raise ValueError(f"unknown method {method!r}")
+    if len(y):
+        idx = np.union1d(idx, [np.argmin(y), np.argmax(y)])
+    return idx
+
+
+def _prepare(path, x, y, C=None, title="Total asset", series=None, n_points=2000, method="minmax",
+             width=1200, height=600):
+    # 在主进程里降采样, 只把几千个点交给画图的子进程
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    idx = downsample(y, n_points, method)
+    lines = [("Total_asset", x[idx], y[idx])]
+    for label, s in (series or {}).items():
+        s = np.asarray(s, dtype=np.float64)
+        k = downsample(s, n_points, method)
+        lines.append((label, x[k], s[k]))
+
+    notes = None
+    if C is not None:
+        # 最高点、最低点、初始资金, 用完整的曲线算
+        ind_max, ind_min = int(np.argmax(y)), int(np.argmin(y))
+        notes = (x[ind_max], y[ind_max], x[ind_min], y[ind_min], x[0], y[0])
+    return {"path": path, "title": title, "C": C, "lines": lines, "notes": notes,
+            "width": width, "height": height}
+
+
+def _render(job):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    dpi = 100
+    fig = Figure(figsize=(job["width"] / dpi, job["height"] / dpi), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    for k, (label, x, y) in enumerate(job["lines"]):
+        ax.plot(x, y, "-" if k == 0 else "--", label=label)
+    # 设置其他参数
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Asset(yuan)")
+    ax.set_title(job["title"], fontsize=13)
+
+    C = job["C"]
+    if job["notes"] is not None:
+        x_max, y_max, x_min, y_min, x0, y0 = job["notes"]
+        max_benefit = (y_max - C) * 100 / C
+        min_benefit = (y_min - C) * 100 / C
+        ax.axhline(C, color="red", linestyle="--")
+        ax.text(x_min, y_min, f"Min:{y_min}, Benefit:{min_benefit}%")
+        ax.text(x_max, y_max, f"Max:{y_max}, Benefit:{max_benefit}%")
+        ax.text(x0, y0, f"Orginal Asset:{C}")
+
+    ax.grid(linestyle="--")
+    if len(job["lines"]) > 1:
+        ax.legend()
+    fig.autofmt_xdate()
+
+    path = job["path"]
+    if os.path.splitext(path)[1].lower() in (".html", ".htm"):
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png")
+        image = base64.b64encode(buf.getvalue()).decode("ascii")
+        rows = ""
+        if job["notes"] is not None:
+            rows = (f"<tr><td>Max</td><td>{x_max}</td><td>{y_max}</td><td>{max_benefit}%</td></tr>"
+                    f"<tr><td>Min</td><td>{x_min}</td><td>{y_min}</td><td>{min_benefit}%</td></tr>"
+                    f"<tr><td>Orginal Asset</td><td>{x0}</td><td>{C}</td><td></td></tr>")
+        title = html.escape(job["title"])
+        with open(path, "w", encoding="utf-8") as fp:
+            fp.write(f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{title}</title></head><body>"
+                     f"<h3>{title}</h3><img src=\"data:image/png;base64,{image}\">"
+                     f"<table border=\"1\">{rows}</table></body></html>")
+    else:
+        fig.savefig(path)
+    return path
+
+
+@traced()
+def asset_report(path, x, y, C=None, title="Total asset", series=None, n_points=2000, method="minmax",
+                 width=1200, height=600):
+    '''
+    资金曲线画到文件, 不弹窗口; 标注与各策略的 total_asset_plot 相同 (最高点、最低点、初始资金)
+
+    :param path: 输出文件, .png 或 .html
+    :param x: 图像的x值，一般是日期
+    :param y: 图像y值，一般是total asset value
+    :param C: 初始资金; None 不画标注
+    :param title: 标题
+    :param series: Dict[str, array], 另外要画的曲线, e.g. {"Average_asset(30days)": ...}
+    :param n_points: 降采样后大约保留的点数
+    :param method: "minmax" 或 "lttb", 见 downsample
+    :param width: 图片宽度 (像素)
+    :param height: 图片高度 (像素)
+    :return: path
+    '''
+    return _render(_prepare(path, x, y, C, title, series, n_points, method, width, height))
+
+
+@traced()
+def render_reports(reports, processes=None):
+    '''
+    一批报告一起画: 主进程降采样, 子进程并行画图
+
+    :param reports: Iterable[dict], 每个 dict 是 asset_report 的参数
+    :param processes: 进程数, None 为 CPU 核数, 1 为不开进程池
+    :return: List[str], 生成的文件
+    '''
+    jobs = [_prepare(**r) for r in reports]
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes == 1 or len(jobs) <= 1:
+        return [_render(job) for job in jobs]
+    with Pool(min(processes, len(jobs))) as pool:
+        return pool.map(_render, jobs)
@@ -0,0 +1,396 @@
+import numpy as np
+
+from 性能追踪 import traced
+
+
+def _prefix_sum(x):
+    # cs[t] = x[0] + ... + x[t-1], 沿第0维(时间)累加
+    cs = np.empty((len(x) + 1,) + x.shape[1:])
+    cs[0] = 0.0
+    np.cumsum(x, axis=0, out=cs[1:])
+    return cs
+
+
+# Moving average engine
+@traced()
+def ma_batch(close, windows, dtype=np.float64):
+    '''
+    :param close: array-like, 收盘价序列; 也可以是 (天数, 路径数) 的矩阵, 沿第0维计算
+    :param windows: Iterable[int], 均线天数, e.g. range(5, 251)
+    :return: np.ndarray, shape = (len(windows),) + close.shape, 每一行对应一个窗口的均线
+
+    口径与原 ma_i 一致:
+        index <  i-1: 直接取收盘价
+        index == i-1: close[0:i] 的均值 (i天)
+        index >= i  : close[index-i:index+1] 的均值 (df.loc 两端都包含, 实际是i+1天)
+    用前缀和计算, 每个窗口 O(n), 与窗口长度无关
+    '''
+    close = np.asarray(close, dtype=np.float64)
+    windows = np.atleast_1d(np.asarray(windows, dtype=np.int64))
+    n = len(close)
+    out = np.empty((len(windows),) + close.shape, dtype=dtype)
+    if n == 0:
+        return out
+
+    # 以第一天收盘价为基准做前缀和, 减小长序列的累计误差
+    base = close[0]
+    cs = _prefix_sum(close - base)
+
+    for k, i in enumerate(windows):
+        if i < 1:
+            raise ValueError(f"window must be >= 1, got {i}")
+        row = out[k]
+        row[:] = close
+        if i - 1 < n:
+            row[i - 1] = cs[i] / i + base
+        if i < n:
+            row[i:] = (cs[i + 1:] - cs[:n - i]) / (i + 1) + base
+    return out
+
+
+def ma_array(close, i):
+    '''
+    :param close: array-like, 收盘价序列
+    :param i: int, Number of days
+    :return: np.ndarray, i days of moving average
+    '''
+    return ma_batch(close, [i])[0]
+
+
+def rolling_mean(x, w):
+    '''
+    :param x: array-like
+    :param w: int, 窗口天数
+    :return: np.ndarray, 最近w天(含当天)的均值; 前 w-1 天直接取原值 (净值曲线交易的30天均线口径)
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    out = x.copy()
+    n = len(x)
+    if 1 <= w <= n:
+        cs = _prefix_sum(x)
+        out[w - 1:] = (cs[w:] - cs[:n - w + 1]) / w
+    return out
+
+
+# True range / Average true range
+def true_range(high, low, close):
+    '''
+    :param high: array-like, 最高价(元)
+    :param low: array-like, 最低价(元)
+    :param close: array-like, 收盘价(元)
+    :return: np.ndarray, 每天的真实波幅
+        day1: 最高价 - 最低价
+        最高价 < 昨收: 昨收 - 最低价
+        最低价 > 昨收: 最高价 - 昨收
+        其他: 最高价 - 最低价
+    '''
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+
+    tr = high - low
+    if len(tr) > 1:
+        prev_close = close[:-1]
+        h, l = high[1:], low[1:]
+        tr[1:] = np.where(h < prev_close, prev_close - l,
+                          np.where(l > prev_close, h - prev_close, h - l))
+    return tr
+
+
+def ewm(x, alpha, state=None):
+    '''
+    指数加权均值, 多行 (多个 alpha) 一起算; 给了 state 可以接着上一段继续算
+
+    :param x: np.ndarray, shape = (k, n)
+    :param alpha: np.ndarray, shape = (k,), 每一行的平滑系数
+    :param state: np.ndarray, shape = (k,), 上一期的值, 默认为0
+    :return: np.ndarray, y[t] = (1 - alpha) * y[t-1] + alpha * x[t]
+
+    按块展开递推式: 块内用 cumsum 一次算完, 块长保证 (1-alpha)^(-L) <= 1e6, 不损失精度
+    '''
+    k, n = x.shape
+    out = np.empty_like(x)
+    decay = 1.0 - alpha
+    state = np.zeros(k) if state is None else np.array(state, dtype=np.float64)
+
+    # alpha == 1 的行就是原序列
+    direct = decay <= 0
+    out[direct] = x[direct]
+    rows = np.flatnonzero(~direct)
+    if len(rows) == 0 or n == 0:
+        return out
+
+    d = decay[rows][:, None]
+    a = alpha[rows][:, None]
+    s = state[rows]
+    block = int(np.log(1e6) / -np.log(d.min())) if d.min() < 1 else n
+    block = max(1, min(block, n, 4096))
+
+    powers = d ** np.arange(block)
+    for start in range(0, n, block):
+        seg = x[rows, start:start + block]
+        p = powers[:, :seg.shape[1]]
+        y = p * (d[:, 0] * s)[:, None] + a * p * np.cumsum(seg / p, axis=1)
+        out[rows, start:start + block] = y
+        s = y[:, -1]
+    return out
+
+
+@traced()
+def atr_batch(high, low, close, windows, method="simple", dtype=np.float64):
+    '''
+    :param high: array-like, 最高价(元)
+    :param low: array-like, 最低价(元)
+    :param close: array-like, 收盘价(元)
+    :param windows: Iterable[int], ATR 天数
+    :param method: str, 平滑方式
+        "simple": 最近n天真实波幅的算术平均
+        "wilder": Wilder平滑, alpha = 1/n
+        "ema":    指数平均, alpha = 2/(n+1)
+    :return: np.ndarray, shape = (len(windows),) + close.shape; 价格可以是 (天数, 路径数) 的矩阵
+
+    前 n-1 天直接取真实波幅; 第 n 天取前n天均值; wilder/ema 从第 n 天的均值开始递推
+    '''
+    tr = true_range(high, low, close)
+    windows = np.atleast_1d(np.asarray(windows, dtype=np.int64))
+    if np.any(windows < 1):
+        raise ValueError("ATR window must be >= 1")
+    n = len(tr)
+    k = len(windows)
+    cs = _prefix_sum(tr)
+
+    if method == "simple":
+        out = np.empty((k,) + tr.shape, dtype=dtype)
+        for j, w in enumerate(windows):
+            row = out[j]
+            row[:] = tr
+            if w <= n:
+                row[w - 1:] = (cs[w:] - cs[:n - w + 1]) / w
+        return out
+
+    if method == "wilder":
+        alpha = 1.0 / windows
+    elif method == "ema":
+        alpha = 2.0 / (windows + 1)
+    else:
+        raise ValueError(f"unknown ATR method: {method}")
+
+    # 把第n天的均值当作 alpha * x 注入, 之前置0, 所有窗口一次递推
+    x = np.zeros((k,) + tr.shape)
+    for j, w in enumerate(windows):
+        if w <= n:
+            x[j, w - 1] = cs[w] / w / alpha[j]
+            x[j, w:] = tr[w:]
+    # 多条路径时把路径并到窗口那一维, 一起递推
+    paths = tr[0].size if n else 1
+    x = np.moveaxis(x, 1, -1).reshape(-1, n)
+    out = ewm(x, np.repeat(alpha, paths))
+    out = np.moveaxis(out.reshape((k,) + tr.shape[1:] + (n,)), -1, 1)
+    for j, w in enumerate(windows):
+        out[j, :min(w - 1, n)] = tr[:min(w - 1, n)]
+    return out.astype(dtype, copy=False)
+
+
+def atr_array(high, low, close, n, method="simple"):
+    '''
+    :param n: int, # days of True Ranges we need
+    :param method: str, "simple" / "wilder" / "ema"
+    :return: np.ndarray, Average True Range
+    '''
+    return atr_batch(high, low, close, [n], method)[0]
+
+
+class ATRUpdater:
+    '''
+    逐根K线更新的ATR, 每次 update O(1), 结果与 atr_array 一致
+
+    >>> upd = ATRUpdater(50, method="wilder")
+    >>> for h, l, c in bars:
+    ...     atr = upd.update(h, l, c)
+    '''
+
+    def __init__(self, n, method="simple"):
+        if n < 1:
+            raise ValueError("ATR window must be >= 1")
+        if method not in ("simple", "wilder", "ema"):
+            raise ValueError(f"unknown ATR method: {method}")
+        self.n = n
+        self.method = method
+        self.alpha = 1.0 / n if method == "wilder" else 2.0 / (n + 1)
+        self.count = 0  # 已经更新的K线数
+        self.prev_close = None
+        self.value = None  # 当前ATR
+        self._buf = [0.0] * n  # 最近n天的真实波幅
+        self._sum = 0.0
+
+    def update(self, high, low, close):
+        '''
+        :param high: float, 当天最高价
+        :param low: float, 当天最低价
+        :param close: float, 当天收盘价
+        :return: float, 当天的ATR
+        '''
+        pc = self.prev_close
+        if pc is None or low <= pc <= high:
+            tr = high - low
+        elif high < pc:
+            tr = pc - low
+        else:
+            tr = high - pc
+        self.prev_close = close
+
+        n = self.n
+        slot = self.count % n
+        self._sum += tr - self._buf[slot]
+        self._buf[slot] = tr
+        self.count += 1
+        if self.count % (64 * n) == 0:
+            self._sum = sum(self._buf)  # 定期重算, 消除累计误差
+
+        if self.count < n:
+            self.value = tr
+        elif self.count == n or self.method == "simple":
+            self.value = self._sum / n
+        else:
+            self.value += self.alpha * (tr - self.value)
+        return self.value
+
+
+class MAUpdater:
+    '''
+    逐根K线更新的均线, 每次 update O(1), 结果与 ma_array (即原 ma_i) 一致
+    '''
+
+    def __init__(self, i):
+        if i < 1:
+            raise ValueError(f"window must be >= 1, got {i}")
+        self.i = i
+        self.count = 0
+        self.value = None
+        self._buf = [0.0] * (i + 1)  # ma_i 从第 i+1 天起取 i+1 天的均值
+        self._sum = 0.0
+
+    def update(self, close):
+        '''
+        :param close: float, 当天收盘价
+        :return: float, 当天的均线值
+        '''
+        i = self.i
+        slot = self.count % (i + 1)
+        self._sum += close - self._buf[slot]
+        self._buf[slot] = close
+        self.count += 1
+        if self.count % (64 * (i + 1)) == 0:
+            self._sum = sum(self._buf)  # 定期重算, 消除累计误差
+
+        if self.count < i:
+            self.value = close
+        elif self.count == i:
+            self.value = self._sum / i
+        else:
+            self.value = self._sum / (i + 1)
+        return self.value
+
+
+class RollingMean:
+    '''
+    逐个更新的最近 w 个值的均值, 每次 update O(1), 结果与 rolling_mean 一致
+    '''
+
+    def __init__(self, w):
+        if w < 1:
+            raise ValueError(f"window must be >= 1, got {w}")
+        self.w = w
+        self.count = 0
+        self.value = None
+        self._buf = [0.0] * w
+        self._sum = 0.0
+
+    def update(self, x):
+        '''
+        :param x: float, 新的值
+        :return: float, 前 w-1 个直接返回 x, 之后为最近 w 个值的均值
+        '''
+        w = self.w
+        slot = self.count % w
+        self._sum += x - self._buf[slot]
+        self._buf[slot] = x
+        self.count += 1
+        if self.count % (64 * w) == 0:
+            self._sum = sum(self._buf)  # 定期重算, 消除累计误差
+
+        self.value = x if self.count < w else self._sum / w
+        return self.value
+
+
+class CovarianceUpdater:
+    '''
+    逐根K线更新的协方差矩阵 (k 个序列一起), 每次 update O(k²), 不重新计算整个窗口
+
+    :param k: 序列个数, e.g. 品种数
+    :param window: "rolling" 为窗口天数; "ewma" 时 alpha = 2 / (window + 1)
+    :param method: "rolling" 最近 window 天的样本协方差 (Welford: 加入新的一天, 去掉最旧的一天);
+        "ewma" 指数加权协方差
+
+    >>> upd = CovarianceUpdater(3, window=60)
+    >>> for x in returns:  # x: (3,)
+    ...     cov = upd.update(x)
+    '''
+
+    def __init__(self, k, window=60, method="ewma"):
+        if window < 2:
+            raise ValueError(f"window must be >= 2, got {window}")
+        if method not in ("rolling", "ewma"):
+            raise ValueError(f"unknown covariance method: {method}")
+        self.k = k
+        self.window = window
+        self.method = method
+        self.alpha = 2.0 / (window + 1)
+        self.count = 0
+        self.value = None  # 当前协方差矩阵, 少于2天时为 None
+        self.mean = np.zeros(k)
+        self._m2 = np.zeros((k, k))  # rolling: 离差乘积之和; ewma: 协方差本身
+        self._buf = np.zeros((window, k)) if method == "rolling" else None
+
+    def update(self, x):
+        '''
+        :param x: array, (k,) 当天的值
+        :return: np.ndarray, (k, k) 当前的协方差矩阵; 少于2天时为 None
+        '''
+        x = np.asarray(x, dtype=np.float64)
+        if self.method == "ewma":
+            if self.count == 0:
+                self.mean = x.copy()
+            else:
+                d = x - self.mean
+                self.mean += self.alpha * d
+                self._m2 += self.alpha * np.outer(d, d)
+                self._m2 *= 1 - self.alpha
+            self.count += 1
+            if self.count >= 2:
+                self.value = self._m2.copy()  # 与 rolling 一样每次返回新的矩阵, 之后的更新不影响已返回的
+            return self.value
+
+        w = self.window
+        slot = self.count % w
+        n = min(self.count, w)  # 窗口里现在的天数
+        if n == w:  # 去掉最旧的一天
+            y = self._buf[slot]
+            d = y - self.mean
+            n -= 1
+            self.mean -= d / n
+            self._m2 -= np.outer(d, y - self.mean)
+        self._buf[slot] = x
+        n += 1
+        d = x - self.mean
+        self.mean += d / n
+        self._m2 += np.outer(d, x - self.mean)
+        self.count += 1
+        if self.count % (64 * w) == 0:  # 定期重算, 消除累计误差
+            self.mean = self._buf.mean(axis=0)
+            dev = self._buf - self.mean
+            self._m2 = dev.T @ dev
+
+        if n >= 2:
+            self.value = self._m2 / (n - 1)
+        return self.value
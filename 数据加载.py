@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from 性能追踪 import traced
+
+
+# 缓存目录, 可以用环境变量 ASSET_CACHE_DIR 指定
+CACHE_DIR = os.environ.get("ASSET_CACHE_DIR",
+                           os.path.join(os.path.expanduser("~"), ".cache", "asset-management"))
+
+
+def read_source(path, columns=None):
+    '''
+    :param path: Excel / CSV / Parquet 文件
+    :param columns: List[str], 只读这些列; None 读全部
+    :return: DataFrame
+    '''
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return pd.read_csv(path, usecols=columns)
+    if ext == ".parquet":
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_excel(path, usecols=columns)
+
+
+def cache_path(path, cache_dir=None):
+    '''
+    :param path: 源文件
+    :return: str, 该文件的缓存目录; 文件路径、修改时间、大小任何一个变了, 目录就变
+    '''
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    key = hashlib.sha1(f"{path}|{st.st_mtime_ns}|{st.st_size}".encode()).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir or CACHE_DIR, f"{stem}-{key}")
+
+
+def _column_file(column):
+    return hashlib.sha1(column.encode()).hexdigest()[:16] + ".npy"
+
+
+def _to_array(series):
+    # 文本列先尝试转成日期, 转不了就存定长字符串, 都可以直接 mmap
+    if series.dtype == object or pd.api.types.is_string_dtype(series.dtype):
+        try:
+            return pd.to_datetime(series).to_numpy()
+        except (ValueError, TypeError):
+            return series.astype(str).to_numpy(dtype=str)
+    return series.to_numpy()
+
+
+def _drop_stale(path, keep):
+    # 同一个源文件旧版本的缓存
+    root = os.path.dirname(keep)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    for name in os.listdir(root):
+        other = os.path.join(root, name)
+        if other == keep or not name.startswith(stem + "-"):
+            continue
+        try:
+            with open(os.path.join(other, "source.json"), encoding="utf-8") as fp:
+                if json.load(fp)["path"] != path:
+                    continue
+        except (OSError, ValueError, KeyError):
+            continue
+        shutil.rmtree(other, ignore_errors=True)
+
+
+def _write_columns(path, columns, target):
+    os.makedirs(target, exist_ok=True)
+    source_df = read_source(path, columns)
+    for column in columns:
+        final = os.path.join(target, _column_file(column))
+        tmp = os.path.join(target, f".{os.getpid()}-{_column_file(column)}")
+        np.save(tmp, _to_array(source_df[column]))
+        os.replace(tmp, final)  # 原子替换, 多个进程同时转换也不会读到半个文件
+
+    info = os.path.join(target, "source.json")
+    if not os.path.exists(info):
+        with open(info, "w", encoding="utf-8") as fp:
+            json.dump({"path": os.path.abspath(path)}, fp, ensure_ascii=False)
+        _drop_stale(os.path.abspath(path), target)
+
+
+@traced()
+def load_columns(path, columns, cache_dir=None, mmap=True):
+    '''
+    第一次读取时把需要的列转换成 .npy 缓存 (每列一个文件), 之后直接内存映射, 不再解析 Excel
+
+    :param path: 存有螺纹钢主连数据的 Excel / CSV / Parquet 文件
+    :param columns: List[str], e.g. ["时间", "收盘价(元)"]
+    :param cache_dir: 缓存目录, 默认 CACHE_DIR
+    :param mmap: True 内存映射 (只读); False 读入内存
+    :return: DataFrame, 只包含 columns, 顺序与 columns 一致
+    '''
+    target = cache_path(path, cache_dir)
+    missing = [c for c in columns if not os.path.exists(os.path.join(target, _column_file(c)))]
+    if missing:
+        _write_columns(path, missing, target)
+
+    data = {c: np.load(os.path.join(target, _column_file(c)), mmap_mode="r" if mmap else None)
+            for c in columns}
+    return pd.DataFrame(data, copy=False)
+
+
+def iter_chunks(path, columns, chunksize=1000000):
+    '''
+    分块读取很长的数据 (e.g. 几千万根1分钟K线), 内存只和 chunksize 有关
+
+    :param path: CSV / Parquet 文件
+    :param columns: List[str], 要读的列
+    :param chunksize: 每块的行数
+    :return: Iterator[DataFrame], 每块最多 chunksize 行, 只包含 columns; 时间 列转成日期
+    '''
+    ext = os.path.splitext(path)[1].lower()
+    dates = [c for c in columns if c == "时间"]
+    if ext == ".csv":
+        with pd.read_csv(path, usecols=columns, parse_dates=dates, chunksize=chunksize) as reader:
+            for chunk in reader:
+                yield chunk[columns]
+    elif ext == ".parquet":
+        import pyarrow.parquet as pq
+
+        start = 0
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            chunk = batch.to_pandas()[columns]
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            for c in dates:
+                chunk[c] = pd.to_datetime(chunk[c])
+            start += len(chunk)
+            yield chunk
+    else:
+        raise ValueError(f"only CSV / Parquet can be read in chunks, got {path}")
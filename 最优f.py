@@ -0,0 +1,111 @@
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from 回测内核 import backtest_batch, diminishing_f, fixed_fractional
+
+
+def f_curve(close, C, rule, fs, guarantee, multiplier=10):
+    '''
+    一次回测所有的 f: f 作为 backtest_batch 的一个维度, 每天对所有 f 一起做向量运算
+
+    :param close: array, 收盘价
+    :param C: 初始资金
+    :param rule: function(f) -> SizingRule, f 可以是数组
+        固定分数法:     partial(fixed_fractional, loss_limit=1250)
+        递减f值法:      partial(diminishing_f, loss_limit=1250)
+        移动均线交叉:   partial(ma_crossover, sma, fma, loss_limit=6700)
+    :param fs: Iterable[float], 要算的 f
+    :return: DataFrame, 每个 f 一行
+        f    TWR    geometric_mean    max_drawdown
+        TWR: 最终资金 / 初始资金 (中途资金 <= 0 记为 0, 即爆仓)
+        geometric_mean: 每天资金的几何平均增长倍数, TWR ** (1 / 天数)
+    '''
+    fs = np.asarray(fs, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    result = backtest_batch(close, C, rule(fs), guarantee, multiplier, keep_paths=False)
+    twr = np.where(result["min_equity"] > 0, result["final_equity"] / C, 0.0)
+    return pd.DataFrame({
+        "f": fs,
+        "TWR": twr,
+        "geometric_mean": twr ** (1 / max(len(close) - 1, 1)),
+        "max_drawdown": np.where(twr > 0, result["max_drawdown"], 1.0),
+    })
+
+
+def optimal_f(close, C, rule, guarantee, f_max=1.0, n_grid=2000, tol=1e-5, multiplier=10):
+    '''
+    先在 (0, f_max] 上取 n_grid 个 f 一次算完, 再在最优点两侧的区间里逐步加密, 直到区间宽度 < tol
+
+    :param rule: function(f) -> SizingRule, 见 f_curve
+    :param f_max: f 的上限
+    :param n_grid: 每一轮的点数, 至少 4 (每一轮区间宽度至少缩小到 2 / (n_grid - 1))
+    :param tol: 最终区间宽度, > 0
+    :return: (最优 f, 对应的 TWR, curve)
+        curve: 第一轮密集网格上的 f_curve, 可以用来设置 递减f值法 的档位, 见 diminishing_tiers
+    '''
+    if n_grid < 4:
+        raise ValueError(f"n_grid must be >= 4, got {n_grid}")
+    if tol <= 0:
+        raise ValueError(f"tol must be > 0, got {tol}")
+    fs = np.linspace(0, f_max, n_grid + 1)[1:]
+    curve = f_curve(close, C, rule, fs, guarantee, multiplier)
+
+    twr = curve["TWR"].to_numpy()
+    best = int(np.argmax(twr))
+    best_f, best_twr = fs[best], twr[best]
+    lo, hi = fs[max(best - 1, 0)], fs[min(best + 1, n_grid - 1)]
+    while hi - lo > tol:
+        fs = np.linspace(lo, hi, n_grid)
+        twr = f_curve(close, C, rule, fs, guarantee, multiplier)["TWR"].to_numpy()
+        k = int(np.argmax(twr))
+        if twr[k] > best_twr:
+            best_f, best_twr = fs[k], twr[k]
+        new_lo, new_hi = fs[max(k - 1, 0)], fs[min(k + 1, n_grid - 1)]
+        if new_hi - new_lo >= hi - lo:  # 已经到浮点精度, 区间缩不下去了
+            break
+        lo, hi = new_lo, new_hi
+    return float(best_f), float(best_twr), curve
+
+
+def diminishing_tiers(curve, f, keep=(0.9, 0.75, 0.5, 0.25)):
+    '''
+    从 f 曲线定 递减f值法 的 decrements: 第 k 档取 f 左边、几何平均增长率仍保留 keep[k] 的最小的 f
+
+    :param curve: f_curve / optimal_f 返回的曲线
+    :param f: 开始时用的 f (一般是最优 f)
+    :param keep: 每一档保留的增长率比例 (相对 f 处), 从大到小, 长度 = len(bounds) + 1
+    :return: np.ndarray, decrements, 可以直接传给 diminishing_f
+    '''
+    fs = curve["f"].to_numpy()
+    growth = np.log(np.maximum(curve["geometric_mean"].to_numpy(), 1e-300))  # 每天的对数增长率
+    g = np.interp(f, fs, growth)
+    left = fs <= f
+    decrements = []
+    for p in keep:
+        ok = left & (growth >= p * g)
+        decrements.append(f - (fs[ok].min() if ok.any() else f))
+    return np.array(decrements)
+
+
+if __name__ == '__main__':
+    from 递减f值法 import read_data
+
+    path = "/Users/yuwensun/Documents/实习/申港资管投资部23Summer/资管方法及其应用/螺纹钢主力连续（近10年）.xlsx"
+    df = read_data(path)
+    close = df["收盘价(元)"].to_numpy()
+
+    # 交易参数设置
+    C = 100000  # 初始资金
+    loss_limit = 1250  # 每份合约最大亏损值
+    guarantee = 0.16  # 保证金比例
+
+    f, twr, curve = optimal_f(close, C, partial(fixed_fractional, loss_limit=loss_limit), guarantee)
+    print(f"optimal f: {f:.4f}, TWR: {twr:.4f}")
+
+    decrements = diminishing_tiers(curve, f)
+    print("decrements:", decrements)
+    f, twr, _ = optimal_f(close, C, partial(diminishing_f, loss_limit=loss_limit, decrements=decrements),
+                          guarantee)
+    print(f"diminishing f: {f:.4f}, TWR: {twr:.4f}")
@@ -0,0 +1,256 @@
+import asyncio
+import time
+from array import array
+
+import numpy as np
+
+from 流式回测 import StreamingBacktest
+
+
+# 模拟盘: 行情一根一根K线推过来 (本地 socket 或者不断追加的文件, 代替交易所行情),
+# 每个 (策略, 品种) 一个 StreamingBacktest, 用与 backtest_df 相同的仓位规则逐根算出目标合约数, 发出目标仓位
+# 每根K线从收到到目标仓位全部发出的延迟都记下来, 看 1 秒K线时跟不跟得上
+#
+# 行情每行一根K线 (UTF-8 文本):
+#     品种,时间,收盘价,最高价,最低价[,发送时间]
+# 发送时间为发出那一刻的 time.time(), 有的话另外统计端到端延迟 (含传输和排队)
+#
+# 仓位计算每根K线只要几微秒, 所以在事件循环里直接算, 不开线程; 多路行情各开一个 run 协程一起跑
+
+
+def format_bar(instrument, bar_time, close, high=None, low=None, sent=None):
+    '''
+    :return: str, 一行行情, 以换行结尾
+    '''
+    high = close if high is None else high
+    low = close if low is None else low
+    fields = [instrument, str(bar_time), repr(float(close)), repr(float(high)), repr(float(low))]
+    if sent is not None:
+        fields.append(repr(sent))
+    return ",".join(fields) + "\n"
+
+
+def parse_bar(line):
+    '''
+    :param line: str, format_bar 的格式
+    :return: (品种, 时间, 收盘价, 最高价, 最低价, 发送时间 或 None)
+    '''
+    fields = line.rstrip("\r\n").split(",")
+    if len(fields) not in (5, 6):
+        raise ValueError(f"bad bar line: {line!r}")
+    sent = float(fields[5]) if len(fields) == 6 else None
+    return fields[0], fields[1], float(fields[2]), float(fields[3]), float(fields[4]), sent
+
+
+def replay_bars(frames):
+    '''
+    把历史数据变成逐个时间点的一批K线, 供 simulated_feed / serve_bars 回放
+
+    :param frames: Dict[str, DataFrame], 品种 -> read_data 的结果 (时间, 收盘价(元), 可选 最高价(元)/最低价(元)),
+        各品种按行对齐, 行数要相同
+    :return: generator, 每次一个 List[(品种, 时间, 收盘价, 最高价, 最低价)]
+    '''
+    lengths = {len(df) for df in frames.values()}
+    if len(lengths) > 1:
+        raise ValueError(f"frames have different lengths: {sorted(lengths)}")
+    columns = {}
+    for name, df in frames.items():
+        close = df["收盘价(元)"].to_numpy()
+        high = df["最高价(元)"].to_numpy() if "最高价(元)" in df else close
+        low = df["最低价(元)"].to_numpy() if "最低价(元)" in df else close
+        columns[name] = (df["时间"].astype(str).to_numpy(), close, high, low)
+    for i in range(lengths.pop() if lengths else 0):
+        yield [(name, t[i], c[i], h[i], l[i]) for name, (t, c, h, l) in columns.items()]
+
+
+async def simulated_feed(batches, interval=1.0):
+    '''
+    进程内模拟行情: 每 interval 秒发出一批K线 (按发出时刻对齐, 不累计漂移)
+    :param batches: replay_bars 的结果
+    :return: async generator, 每次一行行情
+    '''
+    start = time.perf_counter()
+    for k, batch in enumerate(batches):
+        delay = start + k * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        sent = time.time()
+        for bar in batch:
+            yield format_bar(*bar, sent=sent)
+
+
+async def serve_bars(batches, host="127.0.0.1", port=0, interval=1.0):
+    '''
+    本地模拟交易所: 每个连上的客户端从头收到 batches 的全部K线, 每 interval 秒一批, 发完断开
+    :param batches: function() -> replay_bars 的结果; 每个客户端调用一次
+    :return: asyncio.Server, 端口为 server.sockets[0].getsockname()[1]
+    '''
+    async def handle(reader, writer):
+        try:
+            async for line in simulated_feed(batches(), interval):
+                writer.write(line.encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+async def socket_feed(host, port):
+    '''
+    :return: async generator, 从 socket 逐行读行情, 对方断开时结束
+    '''
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            yield line.decode()
+    finally:
+        writer.close()
+
+
+async def tail_file(path, poll=0.05, idle_timeout=None):
+    '''
+    不断追加写入的行情文件 (类似 tail -f)
+    :param poll: 读到文件末尾后等多少秒再读
+    :param idle_timeout: 这么多秒没有新数据就结束; None 一直等
+    :return: async generator, 逐行产出行情
+    '''
+    with open(path, encoding="utf-8") as fp:
+        partial = ""
+        idle = 0.0
+        while True:
+            line = fp.readline()
+            if not line:
+                if idle_timeout is not None and idle >= idle_timeout:
+                    break
+                await asyncio.sleep(poll)
+                idle += poll
+                continue
+            idle = 0.0
+            partial += line
+            if partial.endswith("\n"):  # 写了一半的行等下次读全
+                yield partial
+                partial = ""
+
+
+class PaperTrader:
+    '''
+    模拟盘: 多个 (策略, 品种) 一起按行情更新仓位, 目标合约数变化时发出目标仓位
+
+    >>> trader = PaperTrader(budget=0.05)
+    >>> trader.add("ff", "螺纹钢", StreamingBacktest(C, fixed_fractional(0.1, 1250), 0.16))
+    >>> trader.add("atr", "螺纹钢", StreamingBacktest.volatility_ratio(C, 0.02, 10, 0.16))
+    >>> await trader.run(socket_feed("127.0.0.1", port))
+    >>> trader.latency_report()
+
+    :param budget: 每根K线允许的延迟 (秒), 从收到这一行到这个品种的目标仓位全部发出; 超过的记为 late
+    :param on_order: function(order), 每个目标仓位调用一次; None 时放进 self.orders (asyncio.Queue)
+    '''
+
+    def __init__(self, budget=0.05, on_order=None):
+        self.budget = budget
+        self.on_order = on_order
+        self.orders = asyncio.Queue()
+        self.strategies = {}  # 品种 -> [(策略名, StreamingBacktest)]
+        self.bars = 0
+        self.late = 0
+        self.latency = array("d")  # 每根K线的处理延迟 (秒)
+        self.end_to_end = array("d")  # 行情里带发送时间时, 发送到目标仓位发出 (秒)
+
+    def add(self, name, instrument, backtest):
+        '''
+        :param name: 策略名
+        :param instrument: 品种, 与行情里的品种名一致
+        :param backtest: StreamingBacktest, 决定仓位规则和初始资金
+        '''
+        self.strategies.setdefault(instrument, []).append((name, backtest))
+
+    def _emit(self, order):
+        if self.on_order is None:
+            self.orders.put_nowait(order)
+        else:
+            self.on_order(order)
+
+    def on_line(self, line, received=None):
+        '''
+        处理一行行情
+        :param received: 收到这一行的 time.perf_counter(), 默认现在
+        :return: 这根K线的处理延迟 (秒)
+        '''
+        received = time.perf_counter() if received is None else received
+        instrument, bar_time, close, high, low, sent = parse_bar(line)
+        for name, bt in self.strategies.get(instrument, ()):
+            prev = bt.con_num
+            con, total, _, _ = bt.on_bar(close, high, low)
+            if prev is None or con != prev:
+                self._emit({"strategy": name, "instrument": instrument, "time": bar_time, "target": int(con),
+                            "change": int(con - (prev or 0)), "price": close, "equity": total})
+
+        done = time.perf_counter()
+        latency = done - received
+        self.bars += 1
+        self.latency.append(latency)
+        if latency > self.budget:
+            self.late += 1
+        if sent is not None:
+            self.end_to_end.append(time.time() - sent)
+        return latency
+
+    async def run(self, feed):
+        '''
+        :param feed: async iterable, 每次一行行情, e.g. socket_feed / tail_file / simulated_feed
+        多路行情: await asyncio.gather(trader.run(feed1), trader.run(feed2))
+        '''
+        async for line in feed:
+            self.on_line(line, time.perf_counter())
+            await asyncio.sleep(0)  # 让消费 orders 的协程有机会运行
+
+    def positions(self):
+        '''
+        :return: Dict[(策略名, 品种), dict], 当前的合约数和资金
+        '''
+        return {(name, instrument): {"contract_number": bt.con_num, "Total_asset": bt.total_asset,
+                                     "Used_asset": bt.used_asset, "Lever_ratio": bt.lever_ratio}
+                for instrument, pairs in self.strategies.items() for name, bt in pairs}
+
+    def latency_report(self, percentiles=(50, 90, 99, 99.9)):
+        '''
+        :return: dict, 延迟的分位数 (毫秒), 以及K线数、超过 budget 的根数
+        '''
+        report = {"bars": self.bars, "late": self.late, "budget_ms": self.budget * 1e3}
+        for key, values in (("latency", self.latency), ("end_to_end", self.end_to_end)):
+            if len(values) == 0:
+                continue
+            ms = np.frombuffer(values, dtype=np.float64) * 1e3
+            for p, v in zip(percentiles, np.percentile(ms, percentiles)):
+                report[f"{key}_p{p:g}_ms"] = float(v)
+            report[f"{key}_max_ms"] = float(ms.max())
+        return report
+
+
+if __name__ == '__main__':
+    from 回测内核 import fixed_fractional
+    from 波动比例法 import read_data
+
+    path = "/Users/yuwensun/Documents/实习/申港资管投资部23Summer/资管方法及其应用/螺纹钢主力连续（近10年）.xlsx"
+    frames = {"螺纹钢": read_data(path)}
+
+    async def main():
+        # 本地 socket 模拟交易所, 1 秒一根K线 (只回放前 60 根)
+        server = await serve_bars(lambda: (b for _, b in zip(range(60), replay_bars(frames))), interval=1.0)
+        port = server.sockets[0].getsockname()[1]
+
+        trader = PaperTrader(budget=0.05, on_order=print)
+        trader.add("fixed_fractional", "螺纹钢", StreamingBacktest(100000, fixed_fractional(0.1, 1250), 0.16))
+        trader.add("volatility_ratio", "螺纹钢", StreamingBacktest.volatility_ratio(100000, 0.02, 10, 0.16))
+        trader.add("ma_crossover", "螺纹钢", StreamingBacktest.ma_crossover(1000000, 0.3, 6700, 0.16))
+        async with server:
+            await trader.run(socket_feed("127.0.0.1", port))
+        print(trader.latency_report())
+
+    asyncio.run(main())
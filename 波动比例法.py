@@ -1,8 +1,9 @@
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from datetime import datetime
+
+from 回测内核 import backtest_result, volatility_ratio
+from 指标 import atr_array, atr_batch
+from 数据加载 import load_columns
+from 报告 import asset_report
 
 
 def read_data(path):
@@ -14,46 +15,30 @@ def read_data(path):
     ...         ...          ...         ...
 
     '''
-    source_df = pd.read_excel(path)
-    df = source_df[["时间", "最高价(元)", "最低价(元)", "收盘价(元)"]]
-    return df
+    return load_columns(path, ["时间", "最高价(元)", "最低价(元)", "收盘价(元)"])  # 第一次之后走缓存
 
 
-def ATR(df, n):
+def ATR(df, n, method="simple"):
     '''
     :param df:
     时间      最高价(元)    最低价(元)     收盘价(元)
     ...         ...          ...         ...
     ...         ...          ...         ...
-    :param path: 存有n years螺纹钢主连的收盘价等数据
-    :param n: # days of True Ranges we need
-    :return:
-    时间      开盘价(元)     收盘价(元)
-    ...         ...          ...
-    ...         ...          ...
+    :param n: # days of True Ranges we need; 传入list则一次算出多个n, 返回二维数组
+    :param method: "simple" / "wilder" / "ema", 见 指标.atr_batch
+    :return: np.ndarray, Average True Range
 
     '''
-    pmax = df["最高价(元)"]
-    pmin = df["最低价(元)"]
-    pclose = df["收盘价(元)"]
-    atr = (pmax[0] - pmin[0]) * np.ones(len(df))
-
-    for i in range(1, len(df)):
-        if (pmax[i] < pclose[i - 1]):
-            atr[i] = pclose[i - 1] - pmin[i]
-        elif (pmin[i] > pclose[i - 1]):
-            atr[i] = pmax[i] - pclose[i - 1]
-        else:
-            atr[i] = pmax[i] - pmin[i]
-
-    # Average true range
-    for i in range(n - 1, len(atr)):
-        atr[i] = sum(atr[i - n + 1:i + 1]) / n
+    pmax = df["最高价(元)"].to_numpy()
+    pmin = df["最低价(元)"].to_numpy()
+    pclose = df["收盘价(元)"].to_numpy()
 
-    return atr
+    if np.ndim(n) == 0:
+        return atr_array(pmax, pmin, pclose, n, method)
+    return atr_batch(pmax, pmin, pclose, n, method)
 
 
-def backtest_df(df, C, atr, vol, vp, guarantee):
+def backtest(df, C, atr, vol, vp, guarantee, con_dtype=np.int32, dtype=np.float64):
     '''
     :param df: DataFrame
     时间      最高价(元)    最低价(元)     收盘价(元)
@@ -65,45 +50,40 @@ def backtest_df(df, C, atr, vol, vp, guarantee):
     :param vol: float; 能够接受的最大波动比例
     :param vp: int; 每个点的对应价格
     :param guarantee: float; 保证金比例
-    :return: DataFrame
+    :param con_dtype: 合约数的类型
+    :param dtype: 资金/比例的类型, np.float32 可以省一半内存
+    :return: BacktestResult, 结果列放在各自的数组里, 不修改 df; 要 DataFrame 用 backtest_df
+    '''
+    result = backtest_result(df, C, volatility_ratio(atr, vol, vp), guarantee, con_dtype, dtype)
+    columns = result.columns
+    result.columns = {"contract_number": columns["contract_number"], "Total_asset": columns["Total_asset"],
+                      "Used_asset(%)": 100 * columns["Used_asset"], "Lever_ratio": columns["Lever_ratio"]}
+    return result
+
+
+def backtest_df(df, C, atr, vol, vp, guarantee):
+    '''
+    与 backtest 相同, 结果转成 DataFrame
+    :return: 新的 DataFrame, df 本身不变
         时间      收盘价(元)      contract_number     Total_asset     Used_asset
         ...         ...             ...                 ...             ...
         ...         ...             ...                 ...             ...
     '''
+    return backtest(df, C, atr, vol, vp, guarantee).to_frame()
 
-    con_num1 = int((C * vol) / (atr[0] * vp))  # 合约数 at day1
-
-    total_asset = C * np.ones(len(df))  # 总资金
-    ave_asset = C * np.ones(len(df))  # 30天平均资金
-    con_num = con_num1 * np.ones(len(df))  # 合约数
-    used_asset = (con_num1 * 10 *
-                  df["收盘价(元)"][0] * guarantee / C) * np.ones(len(df))  # 占用资金 at day1
-    lever_ratio = (con_num1 * 10 *
-                   df["收盘价(元)"][0] / C) * np.ones(len(df))  # 杠杆率 at day1
-
-    for index in range(1, len(df)):
-        # Total asset
-        total = con_num[index - 1] * 10 * (df["收盘价(元)"][index] - df["收盘价(元)"][index - 1])
-        total_asset[index] = total_asset[index - 1] + total
-
-        con_num[index] = int((total_asset[index] * vol) / (atr[index] * vp))
-        used_asset[index] = (100) * con_num[index] * 10 * df["收盘价(元)"][index] * guarantee / total_asset[index]
-        lever_ratio[index] = con_num[index] * 10 * df["收盘价(元)"][index] / total_asset[index]
 
-    df["contract_number"] = con_num
-    df["Total_asset"] = total_asset
-    df["Used_asset(%)"] = used_asset
-    df["Lever_ratio"] = lever_ratio
-
-    return df
-
-
-def total_asset_plot(x, y, C):
+def total_asset_plot(x, y, C, path=None):
     '''
     :param x: 图像的x值，一般是日期
     :param y: 图像y值，一般是total asset value
+    :param path: 保存为 .png / .html 文件 (不弹窗口, 曲线降采样); None 则 plt.show()
     :return: None，因为要画图
     '''
+    if path is not None:
+        asset_report(path, x, y, C, "Total asset when using Fixed Fractional")
+        return
+
+    import matplotlib.pyplot as plt  # 只在画图时加载
     fig, ax = plt.subplots()
     ax.plot(x, y)
     # 设置其他参数
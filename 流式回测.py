@@ -0,0 +1,363 @@
+import pickle
+from functools import partial
+
+import numpy as np
+
+from 回测内核 import (BacktestResult, SizingRule, backtest_continue, crossover_signal, ma_crossover,
+                  volatility_ratio)
+from 指标 import ATRUpdater, MAUpdater, RollingMean, atr_array, ewm, ma_array, rolling_mean, true_range
+
+
+# 每根K线先更新的指标, update(close, high, low) 返回当天写进 aux 的值
+class ATRFeed:
+    def __init__(self, n, method="simple"):
+        self.atr = ATRUpdater(n, method)
+
+    def update(self, close, high, low):
+        return self.atr.update(high, low, close)
+
+
+class CrossoverFeed:
+    '''
+    慢线/快线用 MAUpdater 增量更新, 输出与 回测内核.crossover_signal 相同的信号
+    '''
+
+    def __init__(self, slow, fast):
+        self.sma = MAUpdater(slow)
+        self.fma = MAUpdater(fast)
+        self.prev = None  # 前一天的 (慢线, 快线)
+
+    def update(self, close, high, low):
+        s = self.sma.update(close)
+        f = self.fma.update(close)
+        sig = 0.0
+        if self.prev is not None:
+            prev_s, prev_f = self.prev
+            if prev_s > prev_f and s < prev_f:
+                sig = 1.0
+            elif prev_s < prev_f and s > prev_f:
+                sig = -1.0
+        self.prev = (s, f)
+        return sig
+
+
+def _volatility_rule(vol, vp, aux0):
+    return volatility_ratio(np.array([aux0[0]]), vol, vp)
+
+
+def _crossover_rule(f, loss_limit, aux0):
+    return ma_crossover(np.zeros(1), np.zeros(1), f, loss_limit)
+
+
+class StreamingBacktest:
+    '''
+    逐根K线回测: 每来一根K线调用一次 on_bar, 只更新当天的仓位和资金, O(1)
+    结果与 回测内核.backtest_arrays 在整段历史上的结果一致, 可以 save 下来, 第二天接着 on_bar
+
+    >>> bt = StreamingBacktest(C, fixed_fractional(f, loss_limit), guarantee)
+    >>> for price in df["收盘价(元)"]:
+    ...     con_num, total_asset, used_asset, lever_ratio = bt.on_bar(price)
+    '''
+
+    def __init__(self, C, rule, guarantee, multiplier=10, indicators=(), equity_window=30):
+        '''
+        :param C: 初始资金
+        :param rule: SizingRule; 需要指标的规则传 function(第一天的指标值) -> SizingRule
+        :param guarantee: 保证金比例
+        :param multiplier: 每手合约的吨数
+        :param indicators: 指标, 顺序与 rule 的 aux 一致, 见 ATRFeed / CrossoverFeed
+        :param equity_window: 资金均线的天数 (Average_asset)
+        '''
+        self.C = C
+        self.guarantee = guarantee
+        self.multiplier = multiplier
+        self.indicators = list(indicators)
+        self.count = 0  # 已经处理的K线数
+
+        self.con_num = None
+        self.total_asset = None
+        self.used_asset = None
+        self.lever_ratio = None
+        self.prev_close = None
+        self._equity_ma = RollingMean(equity_window)
+        self.ave_asset = None
+
+        self._rule = rule
+        self._size = None
+        self._params = None
+        self._st = None
+        self._aux = [[0.0] for _ in self.indicators]
+
+    @classmethod
+    def volatility_ratio(cls, C, vol, vp, guarantee, atr_days=50, method="simple", multiplier=10):
+        '''
+        波动比例法, ATR 逐根更新
+        '''
+        return cls(C, partial(_volatility_rule, vol, vp), guarantee, multiplier,
+                   indicators=[ATRFeed(atr_days, method)])
+
+    @classmethod
+    def ma_crossover(cls, C, f, loss_limit, guarantee, slow=75, fast=40, multiplier=10):
+        '''
+        移动均线交叉策略, 均线逐根更新
+        '''
+        return cls(C, partial(_crossover_rule, f, loss_limit), guarantee, multiplier,
+                   indicators=[CrossoverFeed(slow, fast)])
+
+    def on_bar(self, close, high=None, low=None):
+        '''
+        :param close: 当天收盘价
+        :param high: 当天最高价 (ATR 需要), 默认等于收盘价
+        :param low: 当天最低价 (ATR 需要), 默认等于收盘价
+        :return: (contract_number, Total_asset, Used_asset, Lever_ratio), 当天的值
+        '''
+        high = close if high is None else high
+        low = close if low is None else low
+        for k, ind in enumerate(self.indicators):
+            self._aux[k][0] = ind.update(close, high, low)
+
+        if self.count == 0:
+            rule = self._rule
+            if not isinstance(rule, SizingRule):
+                rule = rule([a[0] for a in self._aux])
+            con0, params, st = rule.init(self.C)
+            self._size = rule.size
+            self._params = np.asarray(params, dtype=np.float64).tolist()
+            self._st = np.asarray(st, dtype=np.float64).tolist()
+            self._rule = None  # 之后只用 size, 保证对象可以 pickle
+            total = float(self.C)
+            con = float(con0)
+        else:
+            total = self.total_asset + self.con_num * self.multiplier * (close - self.prev_close)
+            con = self._size(0, total, self.con_num, self._params, self._aux, self._st)
+
+        self.count += 1
+        self.prev_close = close
+        self.total_asset = total
+        self.con_num = con
+        self.used_asset = con * self.multiplier * close * self.guarantee / total
+        self.lever_ratio = con * self.multiplier * close / total
+        self.ave_asset = self._equity_ma.update(total)
+        return self.con_num, self.total_asset, self.used_asset, self.lever_ratio
+
+    def on_bars(self, close, high=None, low=None):
+        '''
+        连续喂入多根K线 (e.g. 补历史), 返回最后一根的结果
+        '''
+        high = close if high is None else high
+        low = close if low is None else low
+        result = None
+        for c, h, l in zip(close, high, low):
+            result = self.on_bar(c, h, l)
+        return result
+
+    def save(self, path):
+        with open(path, "wb") as fp:
+            pickle.dump(self, fp)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as fp:
+            return pickle.load(fp)
+
+
+# 分块回测: 几千万根K线按块读入 (数据加载.iter_chunks), 每块整体向量化计算
+# 窗口类指标把上一块末尾够用的几根K线接在本块前面一起算, 递推类指标带上上一块的最后一个值
+def _keep_tail(tail, new, size):
+    return np.concatenate([tail, new])[-size:] if size else tail[:0]
+
+
+class ATRChunks:
+    '''
+    分块计算的ATR, 结果与整段的 atr_array 一致
+    '''
+
+    def __init__(self, n, method="simple"):
+        if method not in ("simple", "wilder", "ema"):
+            raise ValueError(f"unknown ATR method: {method}")
+        self.n = n
+        self.method = method
+        self.alpha = 1.0 / n if method == "wilder" else 2.0 / (n + 1)
+        self.count = 0  # 之前各块的K线数
+        self.value = None  # 上一块最后一天的ATR
+        self._tail = np.empty((3, 0))  # 上一块末尾 n 根K线的 最高价/最低价/收盘价
+
+    def update(self, close, high, low):
+        '''
+        :return: np.ndarray, 本块每天的ATR
+        '''
+        h, l, c = np.concatenate([self._tail, np.array([high, low, close], dtype=np.float64)], axis=1)
+        m = self._tail.shape[1]
+        if self.method == "simple" or self.count <= self.n:
+            # 前面接的是完整的历史, 或者窗口只需要最近 n 天
+            atr = atr_array(h, l, c, self.n, self.method)[m:]
+        else:
+            atr = ewm(true_range(h, l, c)[None, m:], np.array([self.alpha]), np.array([self.value]))[0]
+        self.count += len(close)
+        self._tail = np.array([h, l, c])[:, -self.n:]
+        if len(atr):
+            self.value = atr[-1]
+        return atr
+
+
+class CrossoverChunks:
+    '''
+    分块计算的均线交叉信号, 结果与整段的 crossover_signal(ma_array(慢线), ma_array(快线)) 一致
+    '''
+
+    def __init__(self, slow, fast):
+        self.slow = slow
+        self.fast = fast
+        self._tail = np.empty(0)  # ma_i 要 i+1 天, 信号还要前一天的均线
+
+    def update(self, close, high, low):
+        '''
+        :return: np.ndarray, 本块每天的信号, 1 / -1 / 0
+        '''
+        c = np.concatenate([self._tail, np.asarray(close, dtype=np.float64)])
+        m = len(self._tail)
+        sig = crossover_signal(ma_array(c, self.slow), ma_array(c, self.fast))[m:]
+        self._tail = c[-(max(self.slow, self.fast) + 1):]
+        return sig
+
+
+class ChunkedBacktest:
+    '''
+    分块回测: 每次 on_chunk 喂入一块K线, 资金、仓位、规则状态、指标窗口都接着上一块, 内存只和块大小有关
+    结果与 回测内核.backtest_arrays 在整段历史上的结果一致
+
+    >>> bt = ChunkedBacktest.volatility_ratio(C, vol, vp, guarantee)
+    >>> summary = bt.run(iter_chunks(path, ["时间", "最高价(元)", "最低价(元)", "收盘价(元)"]))
+    '''
+
+    def __init__(self, C, rule, guarantee, multiplier=10, indicators=(), equity_window=30,
+                 con_dtype=np.int32, dtype=np.float64):
+        '''
+        :param C: 初始资金
+        :param rule: SizingRule; 需要指标的规则传 function(第一天的指标值) -> SizingRule, 同 StreamingBacktest
+        :param guarantee: 保证金比例
+        :param multiplier: 每手合约的吨数
+        :param indicators: 分块指标, 顺序与 rule 的 aux 一致, 见 ATRChunks / CrossoverChunks
+        :param equity_window: 资金均线的天数 (Average_asset)
+        :param con_dtype: 结果里合约数的类型
+        :param dtype: 结果里资金/比例的类型
+        '''
+        self.C = C
+        self.guarantee = guarantee
+        self.multiplier = multiplier
+        self.indicators = list(indicators)
+        self.equity_window = equity_window
+        self.con_dtype = con_dtype
+        self.dtype = dtype
+        self.count = 0  # 已经处理的K线数
+
+        self.con_num = None  # 上一块最后一天的值
+        self.total_asset = None
+        self.prev_close = None
+        self._equity_tail = np.empty(0)
+
+        self._rule = rule
+        self._size = None
+        self._params = None
+        self._st = None
+
+        # 整段的汇总, 逐块更新
+        self.peak = None
+        self.min_equity = None
+        self.max_drawdown = 0.0
+        self.max_lever = None
+
+    @classmethod
+    def volatility_ratio(cls, C, vol, vp, guarantee, atr_days=50, method="simple", multiplier=10, **kwargs):
+        '''
+        波动比例法, ATR 分块计算
+        '''
+        return cls(C, partial(_volatility_rule, vol, vp), guarantee, multiplier,
+                   indicators=[ATRChunks(atr_days, method)], **kwargs)
+
+    @classmethod
+    def ma_crossover(cls, C, f, loss_limit, guarantee, slow=75, fast=40, multiplier=10, **kwargs):
+        '''
+        移动均线交叉策略, 均线分块计算
+        '''
+        return cls(C, partial(_crossover_rule, f, loss_limit), guarantee, multiplier,
+                   indicators=[CrossoverChunks(slow, fast)], **kwargs)
+
+    def on_chunk(self, chunk):
+        '''
+        :param chunk: DataFrame, 一块K线, 至少有 收盘价(元); ATR 还需要 最高价(元) / 最低价(元)
+        :return: BacktestResult, 本块每天的 contract_number / Total_asset / Used_asset / Lever_ratio / Average_asset
+        '''
+        close = chunk["收盘价(元)"].to_numpy(dtype=np.float64)
+        high = chunk["最高价(元)"].to_numpy(dtype=np.float64) if "最高价(元)" in chunk else close
+        low = chunk["最低价(元)"].to_numpy(dtype=np.float64) if "最低价(元)" in chunk else close
+        n = len(close)
+        aux = np.array([ind.update(close, high, low) for ind in self.indicators], dtype=np.float64)
+        aux = aux.reshape(len(self.indicators), n)
+
+        if n == 0:
+            con_num = total_asset = np.empty(0)
+        elif self.count == 0:
+            rule = self._rule
+            if not isinstance(rule, SizingRule):
+                rule = rule([a[0] for a in aux])
+            con0, params, st = rule.init(self.C)
+            self._size = rule.size
+            self._params = np.asarray(params, dtype=np.float64)
+            self._st = np.array(st, dtype=np.float64)
+            self._rule = None
+            con_rest, total_rest = backtest_continue(close[1:], close[0], con0, self.C, self._size,
+                                                     self._params, aux[:, 1:], self._st, self.multiplier)
+            con_num = np.concatenate([[float(con0)], con_rest])
+            total_asset = np.concatenate([[float(self.C)], total_rest])
+        else:
+            con_num, total_asset = backtest_continue(close, self.prev_close, self.con_num, self.total_asset,
+                                                     self._size, self._params, aux, self._st, self.multiplier)
+
+        value = con_num * self.multiplier * close  # 合约价值
+        used_asset = value * self.guarantee / total_asset
+        lever_ratio = value / total_asset
+        w = self.equity_window
+        m = len(self._equity_tail)
+        ave_asset = rolling_mean(np.concatenate([self._equity_tail, total_asset]), w)[m:]
+
+        if n:
+            self.count += n
+            self.con_num = con_num[-1]
+            self.total_asset = total_asset[-1]
+            self.prev_close = close[-1]
+            self._equity_tail = _keep_tail(self._equity_tail, total_asset, w - 1)
+            peak = np.maximum.accumulate(total_asset)
+            if self.peak is not None:
+                peak = np.maximum(peak, self.peak)
+            self.peak = peak[-1]
+            self.max_drawdown = max(self.max_drawdown, ((peak - total_asset) / peak).max())
+            self.min_equity = min(total_asset.min(), total_asset[0] if self.min_equity is None else self.min_equity)
+            self.max_lever = max(lever_ratio.max(), lever_ratio[0] if self.max_lever is None else self.max_lever)
+
+        return BacktestResult(chunk, {
+            "contract_number": con_num.astype(self.con_dtype),
+            "Total_asset": total_asset.astype(self.dtype, copy=False),
+            "Used_asset": used_asset.astype(self.dtype, copy=False),
+            "Lever_ratio": lever_ratio.astype(self.dtype, copy=False),
+            "Average_asset": ave_asset.astype(self.dtype, copy=False),
+        })
+
+    def summary(self):
+        '''
+        :return: dict, 到目前为止整段的 bars / final_equity / min_equity / max_drawdown / max_lever
+        '''
+        return {"bars": self.count, "final_equity": self.total_asset, "min_equity": self.min_equity,
+                "max_drawdown": self.max_drawdown, "max_lever": self.max_lever}
+
+    def run(self, chunks, callback=None):
+        '''
+        :param chunks: Iterable[DataFrame], e.g. 数据加载.iter_chunks(path, columns)
+        :param callback: function(BacktestResult), 每块算完调用一次 (e.g. 追加写到文件); 不需要就不保留每天的结果
+        :return: summary()
+        '''
+        for chunk in chunks:
+            result = self.on_chunk(chunk)
+            if callback is not None:
+                callback(result)
+        return self.summary()
@@ -0,0 +1,132 @@
+import os
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from 回测内核 import backtest_batch, fixed_fractional
+from 参数扫描 import attach_shared, get_shared, shared_arrays
+from 绩效指标 import metrics
+from 固定分数法 import backtest_df
+
+
+# 越小越好的指标, 其余越大越好
+_LOWER_IS_BETTER = ("max_drawdown", "max_drawdown_duration")
+
+
+def walk_forward_windows(n, in_sample, out_sample, anchored=False):
+    '''
+    :param n: 总天数
+    :param in_sample: 样本内天数
+    :param out_sample: 样本外天数, 也是每次向前滚动的天数
+    :param anchored: True 样本内窗口的起点固定在第 0 天, 只往后延长
+    :return: List[(is_start, is_end, oos_start, oos_end)], 左闭右开
+    '''
+    windows = []
+    is_end = in_sample
+    while is_end < n:
+        oos_end = min(is_end + out_sample, n)
+        windows.append((0 if anchored else is_end - in_sample, is_end, is_end, oos_end))
+        is_end = oos_end
+    return windows
+
+
+def _optimize_fold(task):
+    # 在样本内窗口上一次性跑完所有 (f, loss_limit), 返回最优的一组
+    k, start, stop, f_grid, l_grid, C, guarantee, objective = task
+    close = get_shared("close")[start:stop]  # 共享数组上的视图, 不复制
+    con_num, total_asset, used_asset, lever_ratio = backtest_batch(
+        close, C, fixed_fractional(f_grid, l_grid), guarantee)
+    score = metrics(total_asset, con_num)[objective]
+    score = np.where(np.isnan(score), np.inf if objective in _LOWER_IS_BETTER else -np.inf, score)
+    best = int(np.argmin(score) if objective in _LOWER_IS_BETTER else np.argmax(score))
+    return k, f_grid[best], l_grid[best], float(score[best])
+
+
+def walk_forward(df, C, fs, guarantee, in_sample=750, out_sample=250, loss_limits=(1250,),
+                 objective="final_equity", anchored=False, processes=None):
+    '''
+    固定分数法的滚动前推优化: 每个样本内窗口选出最优的 f (和 loss_limit), 用在紧接着的样本外窗口上,
+    各段样本外的资金首尾相接 (下一段的初始资金 = 上一段的最终资金)
+
+    :param df:
+        时间      收盘价(元)
+        ...         ...
+    :param C: 初始资金
+    :param fs: Iterable[float], 备选的风险比例
+    :param guarantee: 保证金比例
+    :param in_sample: 样本内天数
+    :param out_sample: 样本外天数
+    :param loss_limits: Iterable[float], 备选的每份合约最大亏损值
+    :param objective: 样本内的优化目标, 绩效指标.metrics 里的一项, e.g. "final_equity", "sharpe", "calmar"
+    :param anchored: True 样本内窗口从第 0 天开始不断延长; False 固定长度往前滚
+    :param processes: 进程数, None 为 CPU 核数, 1 为不开进程池
+    :return: (final_df, folds)
+        final_df: 样本外各天 (从第一个样本内窗口的最后一天开始)
+            时间      收盘价(元)      contract_number     Total_asset     Used_asset     Lever_ratio     fold     f     loss_limit
+            ...         ...         ...                 ...             ...            ...             ...      ...   ...
+        folds: 每段一行
+            fold    is_start    is_end    oos_start    oos_end    f    loss_limit    in_sample_score
+    '''
+    close = np.ascontiguousarray(df["收盘价(元)"].to_numpy(), dtype=np.float64)
+    windows = walk_forward_windows(len(close), in_sample, out_sample, anchored)
+    if not windows:
+        raise ValueError(f"need more than in_sample={in_sample} bars, got {len(close)}")
+
+    f_grid, l_grid = (g.ravel() for g in np.meshgrid(np.asarray(fs, dtype=np.float64),
+                                                     np.asarray(loss_limits, dtype=np.float64)))
+    tasks = [(k, s, e, f_grid, l_grid, C, guarantee, objective)
+             for k, (s, e, _, _) in enumerate(windows)]
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    # 1. 各段样本内优化互不依赖, 并行
+    serial = processes == 1 or len(tasks) <= 1
+    with shared_arrays({"close": close}, in_process=serial) as specs:
+        if serial:
+            best = [_optimize_fold(task) for task in tasks]
+        else:
+            with Pool(min(processes, len(tasks)), initializer=attach_shared, initargs=(specs,)) as pool:
+                best = pool.map(_optimize_fold, tasks)
+
+    # 2. 样本外依次接上: 每段从前一天收盘按新的 f 重新开仓, 资金接着上一段
+    parts = []
+    equity = C
+    for (k, f, loss_limit, _), (_, _, s, e) in zip(best, windows):
+        part = pd.DataFrame({"收盘价(元)": close[s - 1:e]}, copy=False)
+        part = backtest_df(part, equity, f, loss_limit, guarantee)
+        part["fold"] = k
+        part["f"] = f
+        part["loss_limit"] = loss_limit
+        part.index = np.arange(s - 1, e)
+        parts.append(part if k == 0 else part.iloc[1:])
+        equity = part["Total_asset"].iloc[-1]
+
+    final_df = pd.concat(parts)
+    if "时间" in df:
+        final_df.insert(0, "时间", df["时间"].to_numpy()[final_df.index])
+    final_df = final_df.reset_index(drop=True)
+
+    folds = pd.DataFrame(windows, columns=["is_start", "is_end", "oos_start", "oos_end"])
+    folds.insert(0, "fold", np.arange(len(windows)))
+    folds["f"] = [b[1] for b in best]
+    folds["loss_limit"] = [b[2] for b in best]
+    folds["in_sample_score"] = [b[3] for b in best]
+    return final_df, folds
+
+
+if __name__ == '__main__':
+    from 固定分数法 import read_data, total_asset_plot
+
+    path = "/Users/yuwensun/Documents/实习/申港资管投资部23Summer/资管方法及其应用/螺纹钢主力连续（近10年）.xlsx"
+    df = read_data(path)
+
+    # 交易参数设置
+    C = 50000  # 初始资金
+    guarantee = 0.16  # 保证金比例
+
+    final_df, folds = walk_forward(df, C, fs=np.arange(0.01, 0.31, 0.01), guarantee=guarantee,
+                                   in_sample=750, out_sample=250)
+    print(folds)
+    total_asset_plot(final_df["时间"], final_df["Total_asset"], C)
@@ -1,10 +1,11 @@
-import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from datetime import datetime
 import random
 
+from 回测内核 import backtest_result, ledger_result, ma_crossover
+from 指标 import ma_array
+from 数据加载 import load_columns
+from 报告 import asset_report
+
 
 def read_data(path):
     '''
@@ -14,9 +15,7 @@ def read_data(path):
     ...         ...        ...
     ...         ...        ...
     '''
-    source_df = pd.read_excel(path)
-    df = source_df[["时间", "收盘价(元)","涨跌幅(%)"]]
-    return df
+    return load_columns(path, ["时间", "收盘价(元)", "涨跌幅(%)"])  # 第一次之后走缓存
 
 
 def ma_i(df, i):  # Moving average line
@@ -28,19 +27,11 @@ def ma_i(df, i):  # Moving average line
     :param i: int, Number of days
     :return: List, list of i days of moving average
     '''
+    # 前缀和实现, 见 指标.ma_batch; 多个窗口一起算用 ma_batch
+    return ma_array(df["收盘价(元)"].to_numpy(), i)
 
-    ma_i = df.loc[0, "收盘价(元)"] * np.ones(len(df))
-
-    for index in range(1, len(df)):
-        if (index >= i - 1):
-            ma_i[index] = df.loc[index - i:index, "收盘价(元)"].mean()
-        else:
-            ma_i[index] = df.loc[index, "收盘价(元)"]
-
-    return ma_i
 
-
-def backtest_df(df, C, f, loss_limit, guarantee, sma, fma):
+def backtest(df, C, f, loss_limit, guarantee, sma, fma, con_dtype=np.int32, dtype=np.float64):
     '''
     :param df:
         时间      收盘价(元)
@@ -51,56 +42,49 @@ def backtest_df(df, C, f, loss_limit, guarantee, sma, fma):
     :param guarantee: 保证金比例
     :param sma: Slow moving average
     :param fma: Fast moving average
-    :return:
+    :param con_dtype: 合约数的类型
+    :param dtype: 资金/比例的类型, np.float32 可以省一半内存
+    :return: BacktestResult, 结果列放在各自的数组里, 不修改 df; 要 DataFrame 用 backtest_df
+    '''
+    result = backtest_result(df, C, ma_crossover(sma, fma, f, loss_limit), guarantee, con_dtype, dtype)
+    result.columns["Average_asset(30days)"] = np.full(len(df), C, dtype=dtype)  # 30天平均资金
+    return result
+
+
+def backtest_df(df, C, f, loss_limit, guarantee, sma, fma):
+    '''
+    与 backtest 相同, 结果转成 DataFrame
+    :return: 新的 DataFrame, df 本身不变
         时间      收盘价(元)      contract_number     Total_asset     Used_asset
         ...         ...             ...                 ...             ...
         ...         ...             ...                 ...             ...
     '''
-    con_num1 = int(C * f / loss_limit)  # 合约数 at day1
-
-    total_asset = C * np.ones(len(df))  # 总资金 at day1
-    ave_asset = C * np.ones(len(df))  # 30天平均资金
-    con_num = con_num1 * np.ones(len(df))  # 合约数 at day1
-    used_asset = (con_num1 * 10 *
-                  df["收盘价(元)"][0] * guarantee / C) * np.ones(len(df))  # 占用资金 at day1
-    lever_ratio = (con_num1 * 10 *
-                   df["收盘价(元)"][0] / C) * np.ones(len(df))  # 杠杆率 at day1
-
-    for index in range(1, len(df)):
-        # Total asset
-        total = con_num[index - 1] * 10 * (df["收盘价(元)"][index] - df["收盘价(元)"][index - 1])
-        total_asset[index] = total_asset[index - 1] + total
-
-        if (sma[index - 1] > fma[index - 1]) and (sma[index] < fma[index - 1]):  # 上升趋势，做多
-            con_num[index] = int(total_asset[index] * f / loss_limit)
-        elif (sma[index - 1] < fma[index - 1]) and (sma[index] > fma[index - 1]):  # 下降趋势，做空
-            con_num[index] = 0
-        else:
-            con_num[index] = con_num[index - 1]
-
+    return backtest(df, C, f, loss_limit, guarantee, sma, fma).to_frame()
 
-        # Used asset
-        used_asset[index] = con_num[index] * 10 * df["收盘价(元)"][index] * guarantee / total_asset[index]
-        lever_ratio[index] = con_num[index] * 10 * df["收盘价(元)"][index] / total_asset[index]
 
-    df["contract_number"] = con_num
-    df["Total_asset"] = total_asset
-    df["Used_asset"] = used_asset
-    df["Lever_ratio"] = lever_ratio
-    df["Average_asset(30days)"] = ave_asset
-
-    return df
+def backtest_ledger(df, C, f, loss_limit, guarantee, sma, fma):
+    '''
+    与 backtest 相同, 但只保留换仓记录 (合约数只在均线交叉时变), 内存只和交叉次数有关
+    :return: PositionLedger; result["Total_asset"] 等用到时再重建, result.events() 看每次换仓
+    '''
+    return ledger_result(df, C, ma_crossover(sma, fma, f, loss_limit), guarantee)
 
 
-def total_asset_plot(x, y, C):
+def total_asset_plot(x, y, C, path=None):
     '''
     :param x: 图像的x值，一般是日期
     :param y: 图像y值，一般是total asset value
+    :param path: 保存为 .png / .html 文件 (不弹窗口, 曲线降采样); None 则 plt.show()
     :return: None，因为要画图
     '''
+    if path is not None:
+        asset_report(path, x, y, C, "Total asset when using Fixed Fractional")
+        return
+
     # plt.figure(figsize = (20,10))
     # plt.tick_params(axis = 'both', labelsize = 14)
 
+    import matplotlib.pyplot as plt  # 只在画图时加载
     fig, ax = plt.subplots()
     # fig = plt.figure(figsize=(30,20))
     ax.plot(x, y)
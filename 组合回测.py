@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+
+from 回测内核 import fixed_fractional, fixed_ratio, volatility_ratio
+from 数据加载 import load_columns
+from 指标 import CovarianceUpdater, atr_array
+
+
+def read_panel(paths, column="收盘价(元)"):
+    '''
+    :param paths: Dict[str, str], 品种名 -> 数据文件
+    :param column: 要取的列
+    :return: DataFrame, 按 时间 对齐 (只保留所有品种都有数据的日期)
+    时间      螺纹钢     铁矿石    ...
+    ...       ...        ...
+    '''
+    frames = [load_columns(path, ["时间", column]).set_index("时间")[column].rename(name)
+              for name, path in paths.items()]
+    return pd.concat(frames, axis=1, join="inner").sort_index().reset_index()
+
+
+def portfolio_backtest(prices, C, rule, guarantees, multipliers, weights=None):
+    '''
+    多品种共用一份资金: 每天所有品种的盈亏一起计入总资金, 再按各自的资金份额 weights * 总资金 用 rule 计算合约数
+
+    :param prices: array, (天数, 品种数) 收盘价
+    :param C: 初始资金
+    :param rule: SizingRule, 参数可以是 (品种数,) 数组, e.g. 每个品种不同的 loss_limit
+    :param guarantees: 每个品种的保证金比例, 标量或 (品种数,)
+    :param multipliers: 每个品种每手的数量 (螺纹钢 10吨/手), 标量或 (品种数,)
+    :param weights: 每个品种分到的资金比例, 默认平均分配
+    :return:
+        contract_number: (天数, 品种数)
+        Total_asset: (天数,)
+        Used_asset: (天数,) 所有品种占用保证金 / 总资金
+        Lever_ratio: (天数,) 所有品种合约价值 / 总资金
+    '''
+    if rule.size_vec is None:
+        raise ValueError(f"{rule.name} has no vectorized size function")
+    prices = np.asarray(prices, dtype=np.float64)
+    n, k = prices.shape
+    weights = np.full(k, 1.0 / k) if weights is None else np.asarray(weights, dtype=np.float64)
+    multipliers = np.broadcast_to(np.asarray(multipliers, dtype=np.float64), (k,))
+    guarantees = np.broadcast_to(np.asarray(guarantees, dtype=np.float64), (k,))
+
+    con0, params, st = rule.init(weights * C)
+    aux = () if rule.aux is None else np.asarray(rule.aux, dtype=np.float64)
+    st = np.array(st, dtype=np.float64)
+    if st.ndim == 1:
+        st = np.repeat(st[:, None], k, axis=1)
+
+    con_num = np.empty((n, k))
+    total_asset = np.empty(n)
+    con_num[0] = con0
+    total_asset[0] = C
+    diff = np.diff(prices, axis=0) * multipliers  # 每手每天的盈亏
+    for t in range(1, n):
+        total_asset[t] = total_asset[t - 1] + con_num[t - 1] @ diff[t - 1]
+        con_num[t] = rule.size_vec(t, weights * total_asset[t], con_num[t - 1], params, aux, st)
+
+    value = con_num * multipliers * prices  # 合约价值
+    used_asset = (value * guarantees).sum(axis=1) / total_asset
+    lever_ratio = value.sum(axis=1) / total_asset
+    return con_num, total_asset, used_asset, lever_ratio
+
+
+def portfolio_fixed_fractional(prices, C, f, loss_limits, guarantees, multipliers, weights=None):
+    '''
+    固定分数法: 品种 j 的合约数 = int(weights[j] * 总资金 * f / loss_limits[j])
+    '''
+    return portfolio_backtest(prices, C, fixed_fractional(f, np.asarray(loss_limits, dtype=np.float64)),
+                              guarantees, multipliers, weights)
+
+
+def portfolio_fixed_ratio(prices, C, deltas, guarantees, multipliers, weights=None):
+    '''
+    固定比例法: 每个品种按自己的资金份额和 deltas[j] 加仓
+    '''
+    return portfolio_backtest(prices, C, fixed_ratio(np.asarray(deltas, dtype=np.float64)),
+                              guarantees, multipliers, weights)
+
+
+def portfolio_volatility_ratio(prices, highs, lows, C, vol, guarantees, multipliers,
+                               atr_days=50, vps=None, weights=None):
+    '''
+    波动比例法: 品种 j 的合约数 = int(weights[j] * 总资金 * vol / (ATR[j] * vps[j]))
+    :param vps: 每个点的对应价格, 默认等于 multipliers
+    '''
+    atr = atr_array(highs, lows, prices, atr_days)  # (天数, 品种数)
+    vps = multipliers if vps is None else vps
+    return portfolio_backtest(prices, C, volatility_ratio(atr, vol, np.asarray(vps, dtype=np.float64)),
+                              guarantees, multipliers, weights)
+
+
+def portfolio_risk_parity(prices, C, vol, guarantees, multipliers, window=60, method="ewma",
+                          min_periods=None, budgets=None):
+    '''
+    考虑品种间相关性的波动比例法: 每手每天盈亏的协方差矩阵 S 逐天更新 (CovarianceUpdater, 每天 O(k²)),
+    先按 budgets[j] / 波动[j] 分配 (各品种单独的风险按 budgets 分), 再整体缩放,
+    使组合每天盈亏的标准差 = vol * 总资金:
+        raw[j] = budgets[j] / sqrt(S[j, j])
+        合约数[j] = int(raw[j] * vol * 总资金 / sqrt(raw @ S @ raw))
+    相关性高时组合波动大, 所有品种一起减仓; 单品种时就是 int(总资金 * vol / 每手每天盈亏的标准差)
+
+    :param prices: array, (天数, 品种数) 收盘价
+    :param C: 初始资金
+    :param vol: 组合每天盈亏标准差占总资金的比例
+    :param guarantees: 每个品种的保证金比例, 标量或 (品种数,)
+    :param multipliers: 每个品种每手的数量, 标量或 (品种数,)
+    :param window: 协方差的窗口天数, 见 指标.CovarianceUpdater
+    :param method: "ewma" / "rolling"
+    :param min_periods: 协方差至少用多少天的数据, 之前不开仓; 默认 window, 最少 2 (1 天算不出协方差)
+    :param budgets: 每个品种的风险预算, 默认相等
+    :return: 与 portfolio_backtest 相同
+    '''
+    prices = np.asarray(prices, dtype=np.float64)
+    n, k = prices.shape
+    multipliers = np.broadcast_to(np.asarray(multipliers, dtype=np.float64), (k,))
+    guarantees = np.broadcast_to(np.asarray(guarantees, dtype=np.float64), (k,))
+    budgets = np.ones(k) if budgets is None else np.broadcast_to(np.asarray(budgets, dtype=np.float64), (k,))
+    min_periods = max(window if min_periods is None else min_periods, 2)
+
+    cov = CovarianceUpdater(k, window, method)
+    con_num = np.zeros((n, k))
+    total_asset = np.empty(n)
+    total_asset[0] = C
+    diff = np.diff(prices, axis=0) * multipliers  # 每手每天的盈亏
+    for t in range(1, n):
+        total_asset[t] = total_asset[t - 1] + con_num[t - 1] @ diff[t - 1]
+        S = cov.update(diff[t - 1])
+        if cov.count < min_periods or total_asset[t] <= 0:
+            continue
+        sd = np.sqrt(np.diag(S))
+        raw = np.divide(budgets, sd, out=np.zeros(k), where=sd > 0)  # 价格不动的品种不开仓
+        port_sd = np.sqrt(raw @ S @ raw)
+        if port_sd > 0:
+            con_num[t] = np.trunc(raw * (vol * total_asset[t] / port_sd))
+
+    value = con_num * multipliers * prices  # 合约价值
+    used_asset = (value * guarantees).sum(axis=1) / total_asset
+    lever_ratio = value.sum(axis=1) / total_asset
+    return con_num, total_asset, used_asset, lever_ratio
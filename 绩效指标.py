@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+
+def _as_2d(x):
+    x = np.asarray(x, dtype=np.float64)
+    return x.reshape(len(x), -1)
+
+
+def drawdown(total_asset):
+    '''
+    :param total_asset: array, 资金曲线 (天数,) 或一批资金曲线 (天数, B)
+    :return: np.ndarray, 与输入同形状, 每天相对之前最高点的回撤比例
+    '''
+    total_asset = np.asarray(total_asset, dtype=np.float64)
+    peak = np.maximum.accumulate(total_asset, axis=0)
+    return (peak - total_asset) / peak
+
+
+def max_drawdown(total_asset):
+    '''
+    :param total_asset: array, 资金曲线 (天数,) 或 (天数, B)
+    :return: 最大回撤比例, float 或 (B,)
+    '''
+    return drawdown(total_asset).max(axis=0)
+
+
+def cagr(growth, years):
+    '''
+    :param growth: 最终资金 / 初始资金, float 或 array
+    :param years: 年数
+    :return: 年化复合收益率, 与 growth 同形状; 资金亏完 (growth <= 0) 记为 -1, years <= 0 为 nan
+    '''
+    growth = np.asarray(growth, dtype=np.float64)
+    if years <= 0:
+        return np.full(growth.shape, np.nan)
+    with np.errstate(invalid="ignore"):
+        return np.where(growth > 0, np.abs(growth) ** (1 / years) - 1, -1.0)
+
+
+def metrics(total_asset, contract_number=None, periods_per_year=252, risk_free=0.0):
+    '''
+    :param total_asset: array, backtest_df 的 Total_asset; 也可以是一批资金曲线 (天数, B), 例如参数扫描/蒙特卡洛的结果
+    :param contract_number: array, 对应的 contract_number, 用来算持仓时间和换手; 可选
+    :param periods_per_year: 每年的K线数, 日线为 252
+    :param risk_free: 年化无风险利率
+    :return: dict, 输入一条曲线时每项为 float, 输入 (天数, B) 时每项为 (B,)
+        final_equity: 最终资金
+        total_return: 总收益率
+        cagr: 年化复合收益率
+        max_drawdown: 最大回撤比例
+        max_drawdown_duration: 最长的回撤持续天数 (距离上一次创新高)
+        sharpe / sortino / calmar: 年化夏普 / 索提诺 / 卡玛比率
+        time_in_market: 持仓天数占比
+        turnover: 累计交易的合约数 (含第一天开仓)
+    '''
+    single = np.ndim(total_asset) == 1
+    eq = _as_2d(total_asset)
+    n = len(eq)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = eq[-1] / eq[0]
+        annual = cagr(growth, (n - 1) / periods_per_year)
+
+        peak = np.maximum.accumulate(eq, axis=0)
+        max_dd = ((peak - eq) / peak).max(axis=0)
+        idx = np.arange(n)[:, None]
+        last_high = np.maximum.accumulate(np.where(eq >= peak, idx, 0), axis=0)
+        dd_duration = (idx - last_high).max(axis=0)
+
+        ret = eq[1:] / eq[:-1] - 1  # 每天收益率
+        excess = ret - risk_free / periods_per_year
+        mean = excess.mean(axis=0)
+        std = ret.std(axis=0, ddof=1) if n > 2 else np.full(eq.shape[1], np.nan)
+        downside = np.sqrt((np.minimum(excess, 0) ** 2).mean(axis=0))
+        sharpe = np.where(std > 0, mean / std, np.nan) * np.sqrt(periods_per_year)
+        sortino = np.where(downside > 0, mean / downside, np.nan) * np.sqrt(periods_per_year)
+        calmar = np.where(max_dd > 0, annual / max_dd, np.nan)
+
+    result = {
+        "final_equity": eq[-1],
+        "total_return": growth - 1,
+        "cagr": annual,
+        "max_drawdown": max_dd,
+        "max_drawdown_duration": dd_duration,
+        "sharpe": sharpe,
+        "sortino": sortino,
+        "calmar": calmar,
+    }
+    if contract_number is not None:
+        con = _as_2d(contract_number)
+        result["time_in_market"] = (con != 0).mean(axis=0)
+        result["turnover"] = np.abs(con[0]) + np.abs(np.diff(con, axis=0)).sum(axis=0)
+
+    if single:
+        result = {k: v.item() for k, v in result.items()}
+    return result
+
+
+def metrics_table(total_asset, contract_number=None, periods_per_year=252, risk_free=0.0, index=None):
+    '''
+    :return: DataFrame, 每条资金曲线一行, 列见 metrics
+    '''
+    result = metrics(_as_2d(total_asset), None if contract_number is None else _as_2d(contract_number),
+                     periods_per_year, risk_free)
+    return pd.DataFrame(result, index=index)
@@ -0,0 +1,135 @@
+import os
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from 绩效指标 import cagr, max_drawdown, metrics
+from 蒙特卡洛模拟 import bootstrap_index
+
+
+# 回测结果有多少是运气: 把回测的每天 (或每笔交易) 收益率重新抽样, 拼成新的资金曲线,
+# 看最终资金、最大回撤、年化收益率的分布, 给出置信区间
+#
+# 抽样按固定大小的批次分给进程池, 每批用 SeedSequence(seed).spawn 出来的独立随机数生成器,
+# 批次的划分和每批的种子只取决于 seed 和 n_resamples, 所以不管开几个进程结果都一样
+
+
+def pnl_returns(total_asset, contract_number=None, unit="daily"):
+    '''
+    :param total_asset: array, 回测的 Total_asset
+    :param contract_number: array, 回测的 contract_number; unit="trade" 时需要
+    :param unit: "daily" 每天的收益率; "trade" 每笔交易的收益率 (合约数不变的一段算一笔, 空仓的段不算)
+    :return: np.ndarray, 收益率 (小数)
+    '''
+    eq = np.asarray(total_asset, dtype=np.float64)
+    if unit == "daily":
+        return eq[1:] / eq[:-1] - 1
+    if unit != "trade":
+        raise ValueError(f"unknown unit {unit!r}, choose from daily, trade")
+    if contract_number is None:
+        raise ValueError("unit='trade' needs contract_number")
+    con = np.asarray(contract_number)
+    starts = np.flatnonzero(np.r_[True, con[1:] != con[:-1]])
+    ends = np.r_[starts[1:], len(eq) - 1]
+    held = (con[starts] != 0) & (ends > starts)
+    return eq[ends[held]] / eq[starts[held]] - 1
+
+
+_returns = None  # 子进程里的收益率序列
+
+
+def _init_worker(returns):
+    global _returns
+    _returns = returns
+
+
+def _resample(task):
+    # 一批: 用这一批自己的种子抽样, 算每条曲线的 最终资金 / 最大回撤 / 年化收益率
+    seed, m, C, method, block, years = task
+    returns = _returns
+    idx = bootstrap_index(len(returns), len(returns), m, method, block, np.random.default_rng(seed))
+    # 每条曲线在内存里连续 (m, 天数), 沿时间的 cumprod / 最高点都走连续内存
+    eq = np.empty((m, len(returns) + 1))
+    eq[:, 0] = C
+    eq[:, 1:] = returns[idx.T]
+    eq[:, 1:] += 1
+    np.cumprod(eq[:, 1:], axis=1, out=eq[:, 1:])
+    eq[:, 1:] *= C
+    # 与 绩效指标.metrics 同一个口径, confidence_intervals 的 actual 列也用它
+    return eq[:, -1], max_drawdown(eq.T), cagr(eq[:, -1] / C, years)
+
+
+def bootstrap(result, n_resamples=50000, method="stationary", block=20, unit="daily", seed=0,
+              processes=None, chunk=500, periods_per_year=252):
+    '''
+    :param result: 任何 backtest / backtest_df 的结果 (有 Total_asset, unit="trade" 时还要 contract_number)
+    :param n_resamples: 抽样次数
+    :param method: "stationary" / "block" / "iid", 见 蒙特卡洛模拟.bootstrap_index
+    :param block: 平均 (或固定) 段长, 单位是天或笔
+    :param unit: "daily" / "trade", 见 pnl_returns
+    :param seed: 随机种子, seed / n_resamples / chunk 相同则结果相同, 与进程数无关
+    :param processes: 进程数, None 为 CPU 核数, 1 为不开进程池
+    :param chunk: 每批的抽样次数, 内存约为 chunk * 天数 * 16 字节
+    :param periods_per_year: 每年的K线数, 日线为 252
+    :return: DataFrame, 每次抽样一行
+        final_equity    max_drawdown    cagr
+    '''
+    total_asset = np.asarray(result["Total_asset"], dtype=np.float64)
+    contract_number = result["contract_number"] if unit == "trade" else None
+    returns = pnl_returns(total_asset, contract_number, unit)
+    if len(returns) == 0:
+        raise ValueError("no returns to resample")
+    C = total_asset[0]
+    years = (len(total_asset) - 1) / periods_per_year  # 按原来的时间跨度算年化, 按笔抽样也一样
+
+    sizes = [min(chunk, n_resamples - start) for start in range(0, n_resamples, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(s, m, C, method, block, years) for s, m in zip(seeds, sizes)]
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes == 1 or len(tasks) <= 1:
+        _init_worker(returns)
+        parts = [_resample(task) for task in tasks]
+    else:
+        with Pool(processes, initializer=_init_worker, initargs=(returns,)) as pool:
+            parts = pool.map(_resample, tasks)  # 按批次顺序拼接
+
+    return pd.DataFrame({
+        "final_equity": np.concatenate([p[0] for p in parts]),
+        "max_drawdown": np.concatenate([p[1] for p in parts]),
+        "cagr": np.concatenate([p[2] for p in parts]),
+    })
+
+
+def confidence_intervals(samples, levels=(0.9, 0.95), actual=None, periods_per_year=252):
+    '''
+    :param samples: bootstrap 的返回值
+    :param levels: 置信水平, 每个水平给出 (下限, 上限) 两列 (百分位数区间)
+    :param actual: 回测结果, 给了就多一列实际值作对照
+    :return: DataFrame, 每个指标一行
+        (actual)    mean    median    lower(90%)    upper(90%)    lower(95%)    upper(95%)
+    '''
+    table = pd.DataFrame(index=samples.columns)
+    if actual is not None:
+        result = metrics(np.asarray(actual["Total_asset"], dtype=np.float64), periods_per_year=periods_per_year)
+        table["actual"] = [result[c] for c in samples.columns]
+    table["mean"] = samples.mean()
+    table["median"] = samples.median()
+    for level in levels:
+        tail = (1 - level) / 2
+        table[f"lower({level:.0%})"] = samples.quantile(tail)
+        table[f"upper({level:.0%})"] = samples.quantile(1 - tail)
+    return table
+
+
+if __name__ == '__main__':
+    from 固定分数法 import backtest, read_data
+
+    path = "/Users/yuwensun/Documents/实习/申港资管投资部23Summer/资管方法及其应用/螺纹钢主力连续（近10年）.xlsx"
+    df = read_data(path)
+    result = backtest(df, 50000, 0.1, 1250, 0.16)
+
+    samples = bootstrap(result, n_resamples=50000, method="stationary", block=20, seed=0)
+    print(confidence_intervals(samples, actual=result))
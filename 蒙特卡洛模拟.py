@@ -0,0 +1,165 @@
+import pandas as pd
+import numpy as np
+
+from 回测内核 import backtest_batch, fixed_fractional
+from 数据加载 import load_columns
+
+
+def read_data(path):
+    '''
+    :param path: 存有 n(e.g.5,10) years螺纹钢主连的收盘价等数据
+    :return:
+    时间      收盘价(元)    涨跌幅(%)
+    ...         ...        ...
+    ...         ...        ...
+    '''
+    return load_columns(path, ["时间", "收盘价(元)", "涨跌幅(%)"])  # 第一次之后走缓存
+
+
+def bootstrap_index(n_source, n_bars, n_paths, method="iid", block=20, rng=None):
+    '''
+    :param n_source: 历史收益率的天数
+    :param n_bars: 每条路径的天数
+    :param n_paths: 路径数
+    :param method: "iid" 每天独立抽样; "block" 按连续 block 天整段抽样(首尾相接), 保留波动聚集;
+        "stationary" 段长随机 (几何分布, 平均 block 天), 抽出来的序列仍是平稳的 (Politis & Romano)
+    :param block: 每段的天数
+    :return: np.ndarray, shape = (n_bars, n_paths), 历史收益率的下标
+    '''
+    rng = np.random.default_rng(rng)
+    if method == "iid":
+        return rng.integers(0, n_source, size=(n_bars, n_paths))
+    if method == "block":
+        n_blocks = -(-n_bars // block)
+        starts = rng.integers(0, n_source, size=(n_blocks, 1, n_paths))
+        idx = (starts + np.arange(block)[None, :, None]) % n_source
+        return idx.reshape(n_blocks * block, n_paths)[:n_bars]
+    if method == "stationary":
+        # 每天以 1/block 的概率开始新的一段; 段内下标逐天 +1
+        # 按 (路径, 天) 排成一维做, 每条路径第一天必定是新的一段, 所以可以整体向前填充
+        new = rng.random((n_paths, n_bars)) < 1.0 / block
+        new[:, 0] = True
+        pos = np.arange(n_paths * n_bars)
+        first = np.maximum.accumulate(np.where(new.ravel(), pos, 0))  # 所在段的第一天
+        starts = rng.integers(0, n_source, size=n_paths * n_bars)
+        return ((starts[first] + (pos - first)) % n_source).reshape(n_paths, n_bars).T
+    raise ValueError(f"unknown bootstrap method: {method}")
+
+
+def simulate_prices(p0, returns, n_bars, n_paths, method="iid", block=20, rng=None, spread=None):
+    '''
+    :param p0: 起始价格
+    :param returns: array, 历史日收益率 (小数, 不是%)
+    :param spread: array, shape = (len(returns), 2), 每天的 (最高价/收盘价, 最低价/收盘价), 与收益率同一天一起抽样
+    :return: (close, high, low), 都是 (n_bars + 1, n_paths), 第一行为 p0; 没有 spread 时 high = low = close
+    '''
+    returns = np.asarray(returns, dtype=np.float64)
+    idx = bootstrap_index(len(returns), n_bars, n_paths, method, block, rng)
+    close = np.empty((n_bars + 1, n_paths))
+    close[0] = p0
+    np.take(returns, idx, out=close[1:])
+    close[1:] += 1
+    np.cumprod(close[1:], axis=0, out=close[1:])
+    close[1:] *= p0
+    if spread is None:
+        return close, close, close
+
+    spread = np.asarray(spread, dtype=np.float64)
+    high = np.empty_like(close)
+    low = np.empty_like(close)
+    high[0], low[0] = p0 * spread[0, 0], p0 * spread[0, 1]
+    high[1:] = close[1:] * spread[idx, 0]
+    low[1:] = close[1:] * spread[idx, 1]
+    return close, high, low
+
+
+def monte_carlo(returns, p0, C, rule, guarantee, n_paths=10000, n_bars=2500,
+                method="iid", block=20, chunk=2048, seed=None, multiplier=10, spread=None):
+    '''
+    :param returns: array, 历史日收益率 (小数), e.g. df["涨跌幅(%)"] / 100
+    :param p0: 模拟的起始价格
+    :param C: 初始资金
+    :param rule: SizingRule; 需要按路径计算 ATR/均线 的规则传 function(close, high, low) -> SizingRule
+    :param guarantee: 保证金比例
+    :param n_paths: 模拟路径数
+    :param n_bars: 每条路径的天数
+    :param method: "iid" / "block" / "stationary", 见 bootstrap_index
+    :param chunk: 每批同时模拟的路径数, 内存约为 chunk * n_bars * 8 字节的几倍, 与 n_paths 无关
+    :param seed: 随机种子
+    :param spread: 每天的 (最高价/收盘价, 最低价/收盘价), 见 simulate_prices; ATR 类规则需要
+    :return: DataFrame, 每条路径一行
+        final_equity    return_rate(%)    max_drawdown    min_equity    max_lever
+        ...             ...               ...             ...           ...
+    '''
+    rng = np.random.default_rng(seed)
+    parts = []
+    for start in range(0, n_paths, chunk):
+        m = min(chunk, n_paths - start)
+        close, high, low = simulate_prices(p0, returns, n_bars, m, method, block, rng, spread)
+        path_rule = rule(close, high, low) if callable(rule) else rule
+        parts.append(backtest_batch(close, C, path_rule, guarantee, multiplier, keep_paths=False))
+        del close, high, low, path_rule
+
+    final_equity = np.concatenate([r["final_equity"] for r in parts])
+    return pd.DataFrame({
+        "final_equity": final_equity,
+        "return_rate(%)": (final_equity - C) * 100 / C,
+        "max_drawdown": np.concatenate([r["max_drawdown"] for r in parts]),
+        "min_equity": np.concatenate([r["min_equity"] for r in parts]),
+        "max_lever": np.concatenate([r["max_lever"] for r in parts]),
+    })
+
+
+def summarize(result, percentiles=(0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)):
+    '''
+    :param result: monte_carlo 的返回值
+    :return: DataFrame, 各列的分布 (均值, 分位数等), 另加亏损概率
+    '''
+    summary = result.describe(percentiles=list(percentiles))
+    summary.loc["P(loss)"] = (result["return_rate(%)"] < 0).mean()
+    return summary
+
+
+def distribution_plot(result):
+    '''
+    :param result: monte_carlo 的返回值
+    :return: None，因为要画图
+    '''
+    import matplotlib.pyplot as plt  # 只在画图时加载
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 4))
+    ax1.hist(result["return_rate(%)"], bins=100)
+    ax1.axvline(0, color="red", linestyle="--")
+    ax1.set_xlabel("Rate of return(%)")
+    ax1.set_ylabel("Paths")
+    ax1.set_title("Rate of return distribution", fontsize=13)
+
+    ax2.hist(100 * result["max_drawdown"], bins=100)
+    ax2.set_xlabel("Max drawdown(%)")
+    ax2.set_title("Max drawdown distribution", fontsize=13)
+
+    for ax in (ax1, ax2):
+        ax.grid(linestyle="--")
+    # Show the figure
+    plt.show()
+
+
+if __name__ == '__main__':
+    path = "/Users/yuwensun/Documents/实习/申港资管投资部23Summer/资管方法及其应用/螺纹钢主力连续（近10年）.xlsx"
+    df = read_data(path)  # DataFrame contains 时间, 收盘价 and 涨跌幅
+
+    # 交易参数设置
+    C = 1000000  # 初始资金
+    f = 0.1  # 风险比例
+    loss_limit = 1250  # 每份合约最大亏损值
+    guarantee = 0.16  # 保证金比例
+
+    returns = df["涨跌幅(%)"].dropna().to_numpy() / 100
+    p0 = df["收盘价(元)"].iloc[-1]
+    result = monte_carlo(returns, p0, C, fixed_fractional(f, loss_limit), guarantee,
+                         n_paths=100000, n_bars=2500, method="block", block=20, seed=0)
+    # 需要ATR的规则按路径计算, 并传入每天的最高/最低价比例, e.g.
+    # rule = lambda close, high, low: volatility_ratio(atr_array(high, low, close, 50), 0.02, 10)
+    # spread = np.column_stack([df["最高价(元)"] / df["收盘价(元)"], df["最低价(元)"] / df["收盘价(元)"]])
+
+    print(summarize(result))
+    distribution_plot(result)
@@ -1,8 +1,9 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from datetime import datetime
+
+from 回测内核 import backtest_batch, backtest_result, diminishing_f
+from 数据加载 import load_columns
+from 报告 import asset_report
 
 
 def read_data(path): # 读取数据
@@ -13,12 +14,14 @@ def read_data(path): # 读取数据
     ...         ...
     ...         ...
     '''
-    source_df = pd.read_excel(path)
-    df = source_df[["时间", "收盘价(元)"]]
-    return df
+    return load_columns(path, ["时间", "收盘价(元)"])  # 第一次之后走缓存
+
 
+# 默认档位: 总资金 <= 3C, 4C, 8C, 以上 时 f 分别减去 0.025, 0.05, 0.075, 0.0875
+TIERS = ((3, 4, 8), (0.025, 0.05, 0.075, 0.0875))
 
-def backtest_df(df, C, f, loss_limit, guarantee): # 进行回测
+
+def backtest(df, C, f, loss_limit, guarantee, tiers=TIERS, con_dtype=np.int32, dtype=np.float64): # 进行回测
     '''
     :param df:
         日期      收盘价(元)
@@ -27,51 +30,74 @@ def backtest_df(df, C, f, loss_limit, guarantee): # 进行回测
     :param C: 初始资金
     :param loss_limit: 每份合约允许的最大亏损额
     :param guarantee: 保证金比例
-    :return:
+    :param tiers: (bounds, decrements), 档位表, 见 回测内核.diminishing_f
+    :param con_dtype: 合约数的类型
+    :param dtype: 资金/比例的类型, np.float32 可以省一半内存
+    :return: BacktestResult, 结果列放在各自的数组里, 不修改 df; 要 DataFrame 用 backtest_df
+    '''
+    bounds, decrements = tiers
+    return backtest_result(df, C, diminishing_f(f, loss_limit, bounds, decrements), guarantee, con_dtype, dtype)
+
+
+def _stack_tiers(tables):
+    # 档位数不同的表补齐成 (m, B) / (m+1, B): 多出来的上限为 inf (永远到不了), 递减值重复最后一个
+    m = max(len(bounds) for bounds, _ in tables)
+    all_bounds = np.full((m, len(tables)), np.inf)
+    all_decrements = np.empty((m + 1, len(tables)))
+    for j, (bounds, decrements) in enumerate(tables):
+        bounds = np.asarray(bounds, dtype=np.float64)
+        decrements = np.asarray(decrements, dtype=np.float64)
+        if len(decrements) != len(bounds) + 1:
+            raise ValueError(f"tier table {j}: decrements must have one more entry than bounds")
+        if np.any(np.diff(bounds) <= 0):
+            raise ValueError(f"tier table {j}: bounds must be increasing")
+        all_bounds[:len(bounds), j] = bounds
+        all_decrements[:len(decrements), j] = decrements
+        all_decrements[len(decrements):, j] = decrements[-1]
+    return all_bounds, all_decrements
+
+
+def tier_table(df, C, f, loss_limit, guarantee, tables):
+    '''
+    一组档位表在同一条价格上一次算完 (所有表一起逐天推进, 不是每张表跑一遍)
+
+    :param tables: List[(bounds, decrements)], 每张表的档位数可以不同
+    :return: DataFrame, 每张表一行
+        bounds    decrements    final_equity    min_equity    max_drawdown    max_lever
+    '''
+    bounds, decrements = _stack_tiers(tables)
+    result = backtest_batch(df["收盘价(元)"].to_numpy(), C, diminishing_f(f, loss_limit, bounds, decrements),
+                            guarantee, keep_paths=False)
+    return pd.DataFrame({
+        "bounds": [tuple(b) for b, _ in tables],
+        "decrements": [tuple(d) for _, d in tables],
+        **result,
+    })
+
+
+def backtest_df(df, C, f, loss_limit, guarantee, tiers=TIERS):
+    '''
+    与 backtest 相同, 结果转成 DataFrame
+    :return: 新的 DataFrame, df 本身不变
         日期      收盘价(元)      contract_number     Total_asset     Used_asset
         ...         ...         ...                 ...             ...
         ...         ...         ...                 ...             ...
     '''
-    total_asset = C * np.ones(len(df))  # 总资金 at day1
-    con_num = int(C * f / loss_limit) * np.ones(len(df))  # 合约数 at day1
-    used_asset = (int(C * f / loss_limit) * 10 *
-                  df["收盘价(元)"][0] * guarantee / C) * np.ones(len(df))  # 占用资金 at day1
-    lever_ratio = (int(C * f / loss_limit) * 10 *
-                   df["收盘价(元)"][0] / C) * np.ones(len(df))
-
-    for index in range(1, len(df)):
-        # Total asset
-        total = con_num[index - 1] * 10 * (df["收盘价(元)"][index] - df["收盘价(元)"][index - 1])
-        total_asset[index] = total_asset[index - 1] + total
-
-        if (total_asset[index] <= 3 * C):
-            # Contract number
-            con_num[index] = int(total_asset[index] * (f - 0.025) / loss_limit)
-        elif (total_asset[index] <= 4 * C):
-            con_num[index] = int(total_asset[index] * (f - 0.05) / loss_limit)
-        elif (total_asset[index] <= 8 * C):
-            con_num[index] = int(total_asset[index] * (f - 0.075) / loss_limit)
-        else:
-            con_num[index] = int(total_asset[index] * (f - 0.0875) / loss_limit)
-
-        # Used asset
-        used_asset[index] = con_num[index] * 10 * df["收盘价(元)"][index] * guarantee / total_asset[index]
-        lever_ratio[index] = con_num[index] * 10 * df["收盘价(元)"][index] / total_asset[index]
-
-    df["contract_number"] = con_num
-    df["Total_asset"] = total_asset
-    df["Used_asset"] = used_asset
-    df["Lever_ratio"] = lever_ratio
-
-    return df
-
-
-def total_asset_plot(x, y, C): # 资金变化曲线
+    return backtest(df, C, f, loss_limit, guarantee, tiers).to_frame()
+
+
+def total_asset_plot(x, y, C, path=None): # 资金变化曲线
     '''
     :param x: 图像的x值，一般是日期
     :param y: 图像y值，一般是total asset value
+    :param path: 保存为 .png / .html 文件 (不弹窗口, 曲线降采样); None 则 plt.show()
     :return: None，因为要画图
     '''
+    if path is not None:
+        asset_report(path, x, y, C, "Total asset when using Fixed Fractional")
+        return
+
+    import matplotlib.pyplot as plt  # 只在画图时加载
     fig, ax = plt.subplots()
     ax.plot(x, y)
     # 设置其他参数
@@ -110,10 +136,16 @@ if __name__ == '__main__':
     loss_limit = 1250  # 每份合约最大亏损值
     guarantee = 0.16  # 保证金比例
 
+    # 一组档位表一起比较
+    tables = [((3, 4, 8), (0.025, 0.05, 0.075, 0.0875)),
+              ((2, 4, 8), (0.02, 0.04, 0.06, 0.08)),
+              ((5, 10), (0.01, 0.02, 0.03))]
+    print(tier_table(df, C, f, loss_limit, guarantee, tables))
+
     final_df = backtest_df(df, C, f, loss_limit, guarantee)
 
     total_asset_plot(final_df["时间"], final_df["Total_asset"], C)
 
     # print(sum(final_df["contract_number"] == 80.0))
     # print(max(df["contract_number"]))
-    print(df)
\ No newline at end of file
+    print(final_df)
\ No newline at end of file